@@ -1,4 +1,12 @@
+import os
+import glob
+import argparse
+from multiprocessing import pool as mtp
 from Check import metrix
+from Utils import complexset
+
+AFFINITY_METHODS = {'na': metrix.NAAffinity,
+                    'ol': metrix.OLAffinity, 'cooc': metrix.CoocAffinity}
 
 
 def get_cluster_info(path):
@@ -13,5 +21,83 @@ def get_cluster_info(path):
 def main_process(bench_path, predict_path):
     bench_complexes = get_cluster_info(bench_path)
     predict_complexes = get_cluster_info(predict_path)
-    return metrix.RecallQuality(bench_complexes, predict_complexes,
-                                metrix.NAAffinity, 0.25)
+    return metrix.ClusterQualityF1(bench_complexes, predict_complexes,
+                                   metrix.NAAffinity, 0.25).score()
+
+
+# 子进程中的标准复合物，每个进程只在初始化时接收一次
+_worker_bench = None
+
+
+def init_worker(bench):
+    global _worker_bench
+    _worker_bench = bench
+
+
+def evaluate(task):
+    predict_path, affinity_name, thresholds = task
+    try:
+        predict_complexes = get_cluster_info(predict_path)
+    except UnicodeDecodeError:  # 目录中可能混有二进制的中间结果
+        return None
+    computor = metrix.ClusterQualityF1(
+        _worker_bench, predict_complexes, AFFINITY_METHODS[affinity_name])
+    precision, recall, f1 = computor.sweep(thresholds)
+    return len(predict_complexes), precision, recall, f1
+
+
+def batch_process(bench_path, predict_dir, result_path, thresholds=(0.25,), affinity_name='na', pattern='dip_*', processes=4):
+    '''
+    用同一个标准集评价目录下的所有预测结果，结果写成一张表
+    :param pattern: 预测结果文件名的通配符
+    :return: 每个文件的(文件名, 预测数目, precision, recall, f1)
+    '''
+    # 标准集只读取和编号一次
+    bench = complexset.ComplexSet.from_sets(get_cluster_info(bench_path))
+    predict_paths = sorted(path for path in glob.glob(
+        os.path.join(predict_dir, pattern)) if os.path.isfile(path))
+    pool = mtp.Pool(processes=processes, initializer=init_worker,
+                    initargs=(bench,))
+    results = pool.map(evaluate, [(path, affinity_name, thresholds)
+                                  for path in predict_paths])
+    pool.close()
+    pool.join()
+
+    rows = []
+    with open(result_path, 'w') as f:
+        heads = ['file', 'predicted']
+        for name in ('precision', 'recall', 'f1'):
+            heads.extend('{}@{}'.format(name, threshold)
+                         for threshold in thresholds)
+        f.write('\t'.join(heads)+'\n')
+        for path, result in zip(predict_paths, results):
+            if result is None:
+                print('skip {}'.format(path))
+                continue
+            rows.append((os.path.basename(path),)+result)
+            values = [os.path.basename(path), str(result[0])]
+            for scores in result[1:]:
+                values.extend('{:.4f}'.format(score) for score in scores)
+            f.write('\t'.join(values)+'\n')
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='evaluate every prediction file in a directory against a bench file')
+    parser.add_argument('bench_path')
+    parser.add_argument('predict_dir')
+    parser.add_argument('-o', '--output', default='evaluation.tsv')
+    parser.add_argument('-t', '--thresholds', type=float,
+                        nargs='+', default=[0.25])
+    parser.add_argument('-a', '--affinity',
+                        choices=sorted(AFFINITY_METHODS), default='na')
+    parser.add_argument('-p', '--pattern', default='dip_*')
+    parser.add_argument('-j', '--processes', type=int, default=4)
+    args = parser.parse_args()
+    batch_process(args.bench_path, args.predict_dir, args.output,
+                  args.thresholds, args.affinity, args.pattern, args.processes)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,5 +1,7 @@
 import collections
 import numpy as np
+from scipy import sparse
+from Utils import complexset
 
 
 class ItemAffinity():
@@ -13,11 +15,50 @@ class ItemAffinity():
     def score(self):
         NotImplemented
 
+    @classmethod
+    def kernel(cls, inter, size_a, size_b):
+        # 按交集大小批量计算分数，交集为空时分数为0
+        NotImplemented
+
+    @classmethod
+    def matrix(cls, cluster_a, cluster_b, topk=None):
+        '''
+        一次计算两个ComplexSet之间的整个分数矩阵
+        :param topk: None时返回稠密矩阵，否则返回每行只保留最大的topk个分数的稀疏矩阵
+        '''
+        counts = cluster_a.intersection_sizes(cluster_b).tocoo()
+        scores = cls.kernel(counts.data, cluster_a.sizes()[counts.row].astype(np.float64),
+                            cluster_b.sizes()[counts.col].astype(np.float64))
+        result = sparse.csr_matrix((scores, (counts.row, counts.col)),
+                                   shape=counts.shape)
+        if topk is None:
+            return result.toarray()
+        return _row_topk(result, topk)
+
+
+def _row_topk(matrix, topk):
+    rows, cols, data = [], [], []
+    for row in range(matrix.shape[0]):
+        start, end = matrix.indptr[row], matrix.indptr[row+1]
+        values = matrix.data[start:end]
+        chosen = np.argsort(-values, kind='stable')[:topk]
+        rows.append(np.full(len(chosen), row))
+        cols.append(matrix.indices[start:end][chosen])
+        data.append(values[chosen])
+    if not rows:
+        return sparse.csr_matrix(matrix.shape)
+    return sparse.csr_matrix((np.concatenate(data), (np.concatenate(rows), np.concatenate(cols))),
+                             shape=matrix.shape)
+
 
 class NAAffinity(ItemAffinity):  # neighborhood affinity score
     def __init__(self, list_a, list_b):
         super().__init__(list_a, list_b)
 
+    @classmethod
+    def kernel(cls, inter, size_a, size_b):
+        return inter**2/(size_a*size_b)
+
     def score(self):
         set_and = self.set_a & self.set_b
         result = pow(len(set_and), 2)/(len(self.set_a)*len(self.set_b))
@@ -28,6 +69,10 @@ class OLAffinity(ItemAffinity):  # overlap score
     def __init__(self, list_a, list_b):
         super().__init__(list_a, list_b)
 
+    @classmethod
+    def kernel(cls, inter, size_a, size_b):
+        return inter/(size_a*size_b)
+
     def score(self):
         set_and = self.set_a & self.set_b
         result = len(set_and)/(len(self.set_a)*len(self.set_b))
@@ -38,6 +83,10 @@ class CoocAffinity(ItemAffinity):  # co-occurrence score,共同蛋白质数量
     def __init__(self, list_a, list_b):
         super().__init__(list_a, list_b)
 
+    @classmethod
+    def kernel(cls, inter, size_a, size_b):
+        return inter
+
     def score(self):
         set_and = self.set_a & self.set_b
         result = len(set_and)
@@ -46,29 +95,21 @@ class CoocAffinity(ItemAffinity):  # co-occurrence score,共同蛋白质数量
 
 class ClusterQuality():
     def __init__(self, cluster_bench, cluster_predict, affinity_method):
-        self.cluster_bench = cluster_bench
-        self.cluster_predict = cluster_predict
+        # 输入可以是蛋白质id集合的列表，也可以是ComplexSet，统一转换为共用编号表的ComplexSet
+        self.cluster_bench, self.cluster_predict = complexset.align(
+            cluster_bench, cluster_predict)
         self.id_map = self.get_id_map()
         self.affinity_method = affinity_method
         self.affinity_matrix = self.get_affinity_matrix()
 
     def get_id_map(self):
         id_map = collections.defaultdict(int)
-        all_item = set([item for cluster in self.cluster_bench for item in cluster]) | \
-            set([item for cluster in self.cluster_predict for item in cluster])
-        for index, item in enumerate(all_item):
-            id_map[item] = index
+        id_map.update(self.cluster_bench.index.index)
         return(id_map)
 
     def get_affinity_matrix(self):
-        af_matrix = [[0 for j in range(len(self.cluster_predict))]for i in range(
-            len(self.cluster_bench))]
-        for i in range(len(self.cluster_bench)):
-            for j in range(len(self.cluster_predict)):
-                ij_affinity = self.affinity_method(
-                    self.cluster_bench[i], self.cluster_predict[j])
-                af_matrix[i][j] = ij_affinity.score
-        return af_matrix
+        # 整个矩阵由稀疏的关联矩阵乘积一次得到
+        return self.affinity_method.matrix(self.cluster_bench, self.cluster_predict)
 
     def score(self):
         NotImplemented
@@ -78,13 +119,31 @@ class ClusterQualityF1(ClusterQuality):
     def __init__(self, cluster_bench, cluster_predict, affinity_method=None, threshold=None):
         super().__init__(cluster_bench, cluster_predict, affinity_method)
         self.threshold = threshold
-
-    def score(self):
+        # 每个预测结果(列)与每个标准复合物(行)的最大分数，排序后可以对任意阈值二分计数
         np_matrix = np.array(self.affinity_matrix)
-        bool_matrix = np_matrix >= self.threshold
-        prec_matrix = np.sum(bool_matrix, 0) > 0  # 这个计算是不是有问题
-        reca_matrix = np.sum(bool_matrix, 1) > 0
-        precision = sum(prec_matrix)/len(prec_matrix)
-        recall = sum(reca_matrix)/len(reca_matrix)
-        f1 = 2*precision*recall/(precision+recall)
+        self.sorted_col_max = np.sort(np_matrix.max(
+            0)) if np_matrix.size else np.zeros(np_matrix.shape[1])
+        self.sorted_row_max = np.sort(np_matrix.max(
+            1)) if np_matrix.size else np.zeros(np_matrix.shape[0])
+
+    def sweep(self, thresholds):
+        '''
+        一次计算多个阈值下的precision/recall/f1，亲和矩阵只计算一次
+        :param thresholds: 阈值的列表或数组
+        :return: (precision, recall, f1)，每一项都是与thresholds等长的数组
+        '''
+        thresholds = np.asarray(thresholds, dtype=np.float64)
+        # 某一列的最大值不小于阈值，等价于这一列存在不小于阈值的元素
+        prec_num = len(self.sorted_col_max) - \
+            np.searchsorted(self.sorted_col_max, thresholds, side='left')
+        reca_num = len(self.sorted_row_max) - \
+            np.searchsorted(self.sorted_row_max, thresholds, side='left')
+        with np.errstate(divide='ignore', invalid='ignore'):
+            precision = prec_num/len(self.sorted_col_max)
+            recall = reca_num/len(self.sorted_row_max)
+            f1 = 2*precision*recall/(precision+recall)
         return(precision, recall, f1)
+
+    def score(self):
+        precision, recall, f1 = self.sweep([self.threshold])
+        return(precision[0], recall[0], f1[0])
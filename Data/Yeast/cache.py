@@ -0,0 +1,86 @@
+import os
+import re
+import json
+import pickle
+import hashlib
+
+
+def file_digest(path):
+    sha = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            sha.update(block)
+    return sha.hexdigest()
+
+
+def code_version(modules):
+    # 以源码内容作为代码版本，修改任意相关模块都会使缓存失效
+    sha = hashlib.sha1()
+    for module in modules:
+        with open(module.__file__, 'rb') as f:
+            sha.update(f.read())
+    return sha.hexdigest()
+
+
+def complexes_digest(items):
+    # 候选复合物的内容摘要，顺序有意义，复合物内部的蛋白质顺序无意义
+    sha = hashlib.sha1()
+    for item in items:
+        sha.update(repr(sorted(item)).encode('utf8'))
+    return sha.hexdigest()
+
+
+def make_key(files, params, code):
+    '''
+    根据输入文件内容、参数以及代码版本生成缓存的键
+    :param files: 输入文件路径列表
+    :param params: 可以json序列化的参数
+    :param code: code_version的结果
+    '''
+    content = {'files': [file_digest(path) for path in files],
+               'params': params, 'code': code}
+    return hashlib.sha1(json.dumps(content, sort_keys=True, default=repr).encode('utf8')).hexdigest()
+
+
+class ArtifactCache():
+    '''
+    按(阶段, 键)存放的pickle缓存
+    :param root: 缓存目录
+    :param keep: 每个阶段保留的份数，保存新结果时删除更早的，None表示全部保留（目录会一直增长）
+    '''
+
+    def __init__(self, root, keep=1):
+        self.root = root
+        self.keep = keep
+
+    def path(self, stage, key):
+        return os.path.join(self.root, '{}_{}.pkl'.format(stage, key))
+
+    def load(self, stage, key):
+        path = self.path(stage, key)
+        if not os.path.exists(path):
+            return False, None
+        with open(path, 'rb') as f:
+            return True, pickle.load(f)
+
+    def save(self, stage, key, value):
+        os.makedirs(self.root, exist_ok=True)
+        path = self.path(stage, key)
+        # 先写临时文件再替换，中断的写入不会留下损坏的缓存
+        with open(path + '.tmp', 'wb') as f:
+            pickle.dump(value, f)
+        os.replace(path + '.tmp', path)
+        self.prune(stage)
+
+    def entries(self, stage):
+        # 该阶段的所有缓存文件，按修改时间从新到旧
+        pattern = re.compile(r'^{}_[0-9a-f]{{40}}\.pkl$'.format(re.escape(stage)))
+        paths = [os.path.join(self.root, name) for name in os.listdir(self.root)
+                 if pattern.match(name)]
+        return sorted(paths, key=os.path.getmtime, reverse=True)
+
+    def prune(self, stage):
+        if self.keep is None:
+            return
+        for path in self.entries(stage)[self.keep:]:
+            os.remove(path)
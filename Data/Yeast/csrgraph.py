@@ -0,0 +1,240 @@
+import os
+import numpy as np
+import networkx as nx
+from scipy import sparse
+from scipy.sparse import csgraph
+
+
+class _MappedFile():
+    def __init__(self, filename):
+        self.filename = filename
+
+
+class CSRGraph():
+    '''
+    以CSR格式保存的有向图，节点使用int32的位置编号
+    无向图按照原来的处理方式存储为双向边
+    :param ids: 每个位置对应的蛋白质id
+    :param offsets: 长度为n+1，节点i的出边为neighbors[offsets[i]:offsets[i+1]]
+    :param neighbors: 出边的终点
+    :param node_feat: 全局节点特征矩阵，子图与全局图共用
+    :param edge_feat: 全局边特征矩阵，子图与全局图共用
+    :param node_ids: 每个节点在node_feat中的行号，默认为位置编号
+    :param edge_ids: CSR中每条边在edge_feat中的行号，默认为边的位置
+    '''
+
+    def __init__(self, ids, offsets, neighbors, node_feat, edge_feat, directed, node_ids=None, edge_ids=None):
+        self.ids = list(ids)
+        self.id_index = {node: index for index, node in enumerate(self.ids)}
+        self.offsets = offsets
+        self.neighbors_array = neighbors
+        self.node_feat = node_feat
+        self.edge_feat = edge_feat
+        self.directed = directed
+        self.node_ids = np.arange(len(self.ids)) if node_ids is None else node_ids
+        self.edge_ids = np.arange(
+            len(neighbors)) if edge_ids is None else edge_ids
+        self._reverse = None
+
+    def __getstate__(self):
+        # 内存映射的特征矩阵只传递文件路径，子进程重新映射，共享同一份页缓存
+        state = self.__dict__.copy()
+        for name in ('node_feat', 'edge_feat'):
+            matrix = state[name]
+            if isinstance(matrix, np.memmap) and matrix.filename and \
+                    matrix.offset + matrix.nbytes == os.path.getsize(matrix.filename):
+                state[name] = _MappedFile(matrix.filename)
+        return state
+
+    def __setstate__(self, state):
+        for name in ('node_feat', 'edge_feat'):
+            if isinstance(state[name], _MappedFile):
+                state[name] = np.load(state[name].filename, mmap_mode='r')
+        self.__dict__.update(state)
+
+    @classmethod
+    def from_edges(cls, ids, src, dst, node_feat, edge_feat, directed):
+        src = np.asarray(src, dtype=np.int64)
+        dst = np.asarray(dst, dtype=np.int64)
+        edge_rows = np.arange(len(src))
+        if not directed:
+            # 无向图每条边存两次，共用同一行特征；与networkx中逐条边先加(u,v)再加(v,u)的顺序一致，
+            # 同时出现a-b和b-a时两个方向都取最后出现的那一行
+            src, dst = np.stack([src, dst], 1).ravel(), np.stack([dst, src], 1).ravel()
+            edge_rows = np.repeat(edge_rows, 2)
+        num_nodes = len(ids)
+        # 重复的边只保留最后一次出现的特征，与networkx的add_edge一致
+        keys = src * num_nodes + dst
+        _, last = np.unique(keys[::-1], return_index=True)
+        keep = len(keys) - 1 - last  # np.unique的结果已经按(src, dst)排序
+        src, dst, edge_rows = src[keep], dst[keep], edge_rows[keep]
+        offsets = np.zeros(num_nodes+1, dtype=np.int64)
+        np.cumsum(np.bincount(src, minlength=num_nodes), out=offsets[1:])
+        return cls(ids, offsets, dst.astype(np.int32), node_feat,
+                   edge_feat, directed, edge_ids=edge_rows)
+
+    def number_of_nodes(self):
+        return len(self.ids)
+
+    def number_of_edges(self):
+        return len(self.neighbors_array)
+
+    def index(self, nodes):
+        # 不在图中的蛋白质直接忽略，与nx.subgraph一致
+        return np.array(sorted(self.id_index[node] for node in nodes if node in self.id_index), dtype=np.int64)
+
+    def edge_src(self):
+        return np.repeat(np.arange(self.number_of_nodes(), dtype=np.int32), np.diff(self.offsets))
+
+    def successors(self, index):
+        return self.neighbors_array[self.offsets[index]:self.offsets[index+1]]
+
+    def _reverse_graph(self):
+        if self._reverse is None:
+            src = self.edge_src()
+            order = np.argsort(self.neighbors_array, kind='stable')
+            offsets = np.zeros(self.number_of_nodes()+1, dtype=np.int64)
+            np.cumsum(np.bincount(self.neighbors_array,
+                                  minlength=self.number_of_nodes()), out=offsets[1:])
+            self._reverse = (offsets, src[order])
+        return self._reverse
+
+    def predecessors(self, index):
+        if not self.directed:
+            return self.successors(index)
+        offsets, sources = self._reverse_graph()
+        return sources[offsets[index]:offsets[index+1]]
+
+    def neighbors(self, index):
+        # 有向图当成无向图处理时的邻居
+        if not self.directed:
+            return self.successors(index)
+        return np.union1d(self.successors(index), self.predecessors(index))
+
+    def out_degree(self):
+        return np.diff(self.offsets)
+
+    def in_degree(self):
+        return np.bincount(self.neighbors_array, minlength=self.number_of_nodes())
+
+    def degree(self, index=None):
+        # 与nx.DiGraph的degree一致，为入度与出度之和
+        degrees = self.out_degree() + self.in_degree()
+        return degrees if index is None else degrees[index]
+
+    def subgraph_by_index(self, index):
+        index = np.asarray(index, dtype=np.int64)
+        local = np.full(self.number_of_nodes(), -1, dtype=np.int64)
+        local[index] = np.arange(len(index))
+        starts, ends = self.offsets[index], self.offsets[index+1]
+        counts = ends - starts
+        # 取出所有被选中节点的出边，再过滤掉终点不在子图中的边
+        edge_pos = np.repeat(starts - np.cumsum(counts) + counts, counts) + \
+            np.arange(counts.sum())
+        edge_src = np.repeat(np.arange(len(index)), counts)
+        edge_dst = local[self.neighbors_array[edge_pos]]
+        inside = edge_dst >= 0
+        edge_pos, edge_src, edge_dst = edge_pos[inside], edge_src[inside], edge_dst[inside]
+        offsets = np.zeros(len(index)+1, dtype=np.int64)
+        np.cumsum(np.bincount(edge_src, minlength=len(index)),
+                  out=offsets[1:])
+        return CSRGraph([self.ids[i] for i in index], offsets, edge_dst.astype(np.int32),
+                        self.node_feat, self.edge_feat, self.directed,
+                        self.node_ids[index], self.edge_ids[edge_pos])
+
+    def subgraph(self, nodes):
+        return self.subgraph_by_index(self.index(nodes))
+
+    def block_subgraph(self, candidates):
+        '''
+        一次性取出多个候选的导出子图，拼接成分块对角的大图
+        :param candidates: 蛋白质id集合的列表
+        :return: CSRBatch，节点按候选依次拼接，边的端点为拼接后的编号
+        '''
+        index_lists = [self.index(nodes) for nodes in candidates]
+        sizes = np.array([len(index) for index in index_lists], dtype=np.int64)
+        node_offsets = np.zeros(len(index_lists)+1, dtype=np.int64)
+        np.cumsum(sizes, out=node_offsets[1:])
+        nodes = np.concatenate(
+            index_lists) if index_lists else np.zeros(0, dtype=np.int64)
+        segment = np.repeat(np.arange(len(index_lists)), sizes)
+        starts, ends = self.offsets[nodes], self.offsets[nodes+1]
+        counts = ends - starts
+        edge_pos = np.repeat(starts - np.cumsum(counts) + counts, counts) + \
+            np.arange(counts.sum())
+        edge_src = np.repeat(np.arange(len(nodes)), counts)
+        # 每个候选内部的节点已排序，(候选编号, 节点)组成的键整体有序，可以二分查找终点
+        keys = segment * self.number_of_nodes() + nodes
+        query = segment[edge_src] * self.number_of_nodes() + \
+            self.neighbors_array[edge_pos]
+        edge_dst = np.searchsorted(keys, query)
+        inside = edge_dst < len(keys)
+        inside[inside] = keys[edge_dst[inside]] == query[inside]
+        return CSRBatch(self, node_offsets, nodes, edge_src[inside], edge_dst[inside], edge_pos[inside])
+
+    def node_features(self):
+        # 一次索引从全局特征矩阵中取出
+        return self.node_feat[self.node_ids]
+
+    def edge_features(self):
+        return self.edge_feat[self.edge_ids]
+
+    def adjacency(self):
+        num_nodes = self.number_of_nodes()
+        return sparse.csr_matrix((np.ones(self.number_of_edges(), dtype=np.float64),
+                                  self.neighbors_array, self.offsets), shape=(num_nodes, num_nodes))
+
+    def connected_components(self):
+        # 弱连通分量，等价于转换为无向图之后求连通分量
+        if not self.number_of_nodes():
+            return []
+        _, labels = csgraph.connected_components(
+            self.adjacency(), directed=True, connection='weak')
+        components = [set() for _ in range(labels.max()+1)]
+        for node, label in zip(self.ids, labels):
+            components[label].add(node)
+        return components
+
+    def to_networkx(self):
+        res = nx.DiGraph()
+        node_feat, edge_feat = self.node_features(), self.edge_features()
+        for index, node in enumerate(self.ids):
+            res.add_node(node, w=node_feat[index])
+        for edge, (v0, v1) in enumerate(zip(self.edge_src().tolist(), self.neighbors_array.tolist())):
+            res.add_edge(self.ids[v0], self.ids[v1], w=edge_feat[edge])
+        return res
+
+
+class CSRBatch():
+    '''
+    多个导出子图拼接成的分块对角图
+    :param graph: 原图
+    :param node_offsets: 第i个候选的节点为nodes[node_offsets[i]:node_offsets[i+1]]
+    :param nodes: 拼接后的节点在原图中的位置
+    :param src: 边的起点，拼接后的编号，按起点排序
+    :param dst: 边的终点，拼接后的编号
+    :param edge_pos: 边在原图CSR中的位置
+    '''
+
+    def __init__(self, graph, node_offsets, nodes, src, dst, edge_pos):
+        self.graph = graph
+        self.node_offsets = node_offsets
+        self.nodes = nodes
+        self.src = src
+        self.dst = dst
+        self.edge_pos = edge_pos
+
+    def number_of_candidates(self):
+        return len(self.node_offsets) - 1
+
+    def number_of_nodes(self):
+        return len(self.nodes)
+
+    def sizes(self):
+        return np.diff(self.node_offsets)
+
+    def node_segment(self):
+        return np.repeat(np.arange(self.number_of_candidates()), self.sizes())
+
+    def edge_counts(self):
+        return np.bincount(self.node_segment()[self.src], minlength=self.number_of_candidates())
@@ -2,42 +2,39 @@ import pandas as pd
 import random
 import networkx as nx
 import dgl
+import dgl.function as fn
 import torch
-import pickle
 import queue
+import itertools
+import collections
 import os
 import numpy as np
+import sys
 from sklearn import preprocessing
 from multiprocessing import pool as mtp
 from matplotlib import pyplot as plt
+from Data.Yeast import featstore
+from Data.Yeast import csrgraph
+from Data.Yeast import cache
+from Data.Yeast import topology
+from Data.Yeast import sampler
+from Data.Yeast.csrgraph import CSRGraph
+from Utils import complexset
+from Utils.complexset import ComplexSet
+
+
+MERGE_THRESHOLD = 0.8  # 合并时的jaccard阈值
+DUPLICATE_THRESHOLD = 0.25  # 去重时的NA阈值
+STREAM_CHUNK_SIZE = 1000  # 流式转换时每块的候选数目
 
 
 def read_datas(node_path, edge_path):
-    nodes, nodematrix = [], []
-    edges, edgematrix = [], []
-
-    with open(node_path, 'r') as f:
-        nodefeat_names = next(f).strip().split('\t')
-        index_deepwalk = []
-        for index, name in enumerate(nodefeat_names):
-            if "deepwalk" in name:
-                index_deepwalk.append(index)
-        for nodedata in f:
-            nodedata_splited = nodedata.strip().split('\t')
-            node_id = nodedata_splited[0]
-            node_feat = list(map(float, nodedata_splited[1:]))
-            nodes.append(node_id)
-            nodematrix.append(
-                node_feat[min(index_deepwalk):max(index_deepwalk)+1])
-
-    with open(edge_path, 'r')as f:
-        next(f)
-        for edgedata in f:
-            edgedata_splited = edgedata.strip().split('\t')
-            v0, v1 = edgedata_splited[0].split(' ')
-            edge_feat = list(map(float, edgedata_splited[1:]))
-            edges.append([v0, v1])
-            edgematrix.append(edge_feat)
+    # 文本数据第一次读取时转换为二进制存储，之后直接内存映射
+    store = featstore.load_store(node_path, edge_path)
+    nodes = store.ids
+    nodematrix = store.groups['deepwalk']
+    edges = [[nodes[v0], nodes[v1]] for v0, v1 in store.edge_index.tolist()]
+    edgematrix = store.edge_feat
     return nodes, nodematrix, edges, edgematrix
 
 
@@ -49,83 +46,76 @@ def dataprocess(matrix):
 
 
 def subgraphs(complexes, graph):
+    # complexes可以是蛋白质id集合的列表，也可以是ComplexSet，返回相同的类型
     res = []
     for comp in complexes:
-        subgraph = nx.subgraph(graph, comp)
-        subgraph_bi = nx.Graph(subgraph)  # 转换为有向图求解
-        sub_components = nx.connected_components(subgraph_bi)
+        if isinstance(complexes, ComplexSet):
+            comp = complexes.index.decode(comp)
+        subgraph = graph.subgraph(comp)
+        sub_components = subgraph.connected_components()  # 弱连通，相当于转换为无向图求解
         for sub_component in sub_components:
             res.append(sub_component)
+    if isinstance(complexes, ComplexSet):
+        return ComplexSet.from_sets(res, complexes.index)
     return res
 
 
-def get_random_graphs(graph, l_list, target, multi=False):
-    # 好像多进程版本并没有太多效果
-    res = list()
+# 子进程中的随机子图生成器，每个进程只在初始化时接收一次
+_worker_sampler = None
+
+
+def init_sampler_worker(generator):
+    global _worker_sampler
+    _worker_sampler = generator
+
+
+def sample_rng(seed, *key):
+    # 第i个随机子图使用key=(i,)的独立随机数流，只与主种子和i有关，与进程数和调度顺序无关
+    state = np.random.SeedSequence(seed, spawn_key=key).generate_state(2)
+    return random.Random(int(state[0]) << 32 | int(state[1]))
+
+
+def worker_sample(task):
+    sizes, seed, start = task
+    return [_worker_sampler.sample(size, sample_rng(seed, start+i)) for i, size in enumerate(sizes)]
+
+
+def get_random_graphs(graph, l_list, target, multi=False, seed=None, processes=5):
+    '''
+    生成target个随机子图，大小从l_list中随机选取
+    :param seed: 主种子，为None时从全局random中取，因此固定random.seed之后结果也是固定的
+    :param multi: 是否多进程生成，同一个seed下结果与单进程完全一致
+    :return: 蛋白质id集合的列表
+    '''
+    if seed is None:
+        seed = random.getrandbits(64)
+    size_rng = sample_rng(seed)  # 大小在主进程中一次取好
+    sizes = [size_rng.choice(l_list) for i in range(target)]
+    generator = sampler.RandomGraphSampler(graph)  # 抽样表只构建一次
     if multi:
-        pool = mtp.Pool(processes=5)
-        for i in range(target):
-            size = random.choice(l_list)
-            res.append(pool.apply_async(
-                get_single_random_graph_nodes, args=(graph, size)))
-        pool.close()
-        pool.join()
-        return [item.get() for item in res]
+        # 分块提交，每个进程只接收一次生成器
+        chunk_size = max(1, -(-target//(processes*4)))
+        tasks = [(sizes[start:start+chunk_size], seed, start)
+                 for start in range(0, target, chunk_size)]
+        pool = mtp.Pool(processes=processes, initializer=init_sampler_worker,
+                        initargs=(generator,))
+        try:
+            results = pool.map(worker_sample, tasks)
+        finally:
+            pool.terminate()
+            pool.join()
+        return list(itertools.chain.from_iterable(results))
     else:
-        for i in range(target):
-            size = random.choice(l_list)
-            res.append(get_single_random_graph_nodes(graph, size))
-        return res
+        return [generator.sample(size, sample_rng(seed, i)) for i, size in enumerate(sizes)]
 
 
 def get_single_random_graph_nodes(graph, size):  # 这种随机化结果产生的区分度过强，看有没有其他随机的方案
-    # 注意随机游走的时候将有向图当成无向图处理
-    all_nodes = list(graph.nodes.keys())  # 按照权重取值
-    all_node_weights = [graph.degree(node) for node in all_nodes]
-    beginer = random.choices(all_nodes, weights=all_node_weights, k=1)[0]
-    # 按照权重选取下一个点
-    node_set = set([beginer])
-    neighbor_lists = list(set(graph.successors(beginer)) | set(
-        graph.predecessors(beginer)))  # 生成随机图的时候有向图当成无向图处理
-    neighbor_weights = [1 for i in range(len(neighbor_lists))]
-    max_weight = 1
-    while len(node_set) < size and len(neighbor_lists):
-        next_node = random.choices(
-            neighbor_lists, weights=neighbor_weights, k=1)[0]
-        node_index = neighbor_lists.index(next_node)
-        neighbor_lists.pop(node_index)
-        the_weight = neighbor_weights.pop(node_index)
-        max_weight = max(max_weight, the_weight)
-
-        if (the_weight == 1 and max_weight >= 100) or (the_weight == 10 and max_weight >= 10000):  # 密集子图之后不应该再出现低权重图
-            continue
-
-        node_set.add(next_node)
-        neis = list(set(graph.successors(beginer)) | set(
-            graph.predecessors(beginer)))  # 区分有向图和无向图
-        for nei in neis:
-            if nei not in node_set:
-                if nei in neighbor_lists:
-                    nei_index = neighbor_lists.index(nei)
-                    neighbor_weights[nei_index] *= 10  # 强调
-                else:
-                    neighbor_lists.append(nei)
-                    neighbor_weights.append(1)
-    sub_graph = nx.subgraph(graph, node_set)  # 最后还需要在子图里面去除1/4的度小的节点
-    items = [(node, sub_graph.degree(node)) for node in node_set]
-    remove_num_direct = min(len(node_set)//4, 6)  # 也不能去除太多了，最多去除6个
-
-    degrees = [sub_graph.degree(node) for node in node_set]
-    meandegree = (sum(degrees)/len(degrees))
-    sitems = sorted(items, key=lambda i: i[1])
-    res = set()
-    for item in sitems[remove_num_direct:]:
-        if item[1] > int(meandegree/2):  # 按照平均度数再减去一部分
-            res.add(item[0])
-    return res
+    # 注意随机游走的时候将有向图当成无向图处理，需要多次抽样时应直接复用RandomGraphSampler
+    return sampler.RandomGraphSampler(graph).sample(size)
 
 
-def read_bench(path):
+def read_bench(path, index=None):
+    # 给定ProteinIndex时返回ComplexSet，否则返回蛋白质id集合的列表
     res = list()
     with open(path, 'r')as f:
         for line in f:
@@ -137,151 +127,241 @@ def read_bench(path):
             else:
                 pass
             res.append(set(line_splited))
+    if index is not None:
+        return ComplexSet.from_sets(res, index)
     return res
 
 
 # 具体怎么做以后需要改进，子图合并操
-def merged_data(items):
-    all_merged_res = []
+def merged_data(items, threshold=MERGE_THRESHOLD, return_counts=False):
+    '''
+    依次处理每个复合物，与当前已有结果中jaccard大于threshold的全部合并
+    通过蛋白质到结果的倒排索引找到有交集的结果，用并查集记录合并关系，
+    结果与逐一两两比较的做法完全一致
+    :param items: 蛋白质id集合的列表或者ComplexSet，返回相同的类型
+    :param return_counts: 同时返回每个结果由多少个输入复合物合并而来
+    '''
+    if isinstance(items, ComplexSet):
+        # 在编号上做集合运算，不再重复对字符串做哈希
+        merged, counts = merged_data(
+            [item.tolist() for item in items], threshold, True)
+        merged = ComplexSet.from_members(
+            [sorted(item) for item in merged], items.index)
+        return (merged, counts) if return_counts else merged
+    parent, members, absorbed = [], [], []
+    inverted = collections.defaultdict(list)  # 蛋白质 -> 包含它的结果编号，可能已经被合并
+
+    def find(group):
+        while parent[group] != group:
+            parent[group] = parent[parent[group]]
+            group = parent[group]
+        return group
+
     for item in items:
-        cur_merge_target = []
-        tempres = item
-        for index, single_res in enumerate(all_merged_res):
-            if len(item & single_res)/(len(item | single_res)) > 0.8:
-                cur_merge_target.append(index)
-                tempres = tempres | single_res
-        for removeindex in cur_merge_target[::-1]:
-            all_merged_res.pop(removeindex)  # 从后面往前面剔除
-        all_merged_res.append(tempres)
-    res = list()
-    for data in all_merged_res:
-        if len(data) >= 2:
+        item = set(item)
+        # 通过倒排索引统计与每个现有结果的交集大小
+        hits = collections.Counter()
+        for protein in item:
+            if protein in inverted:
+                roots = set(find(group) for group in inverted[protein])
+                inverted[protein] = list(roots)
+                hits.update(roots)
+        targets = [root for root, inter in hits.items()
+                   if inter/(len(item)+len(members[root])-inter) > threshold]
+        new_group = len(parent)
+        parent.append(new_group)
+        absorbed.append(1)
+        # 每次合并都产生新的结果，放到末尾，与原来先删除再追加的顺序一致
+        merged = max([members[root] for root in targets] +
+                     [item], key=len)
+        for root in targets:
+            if members[root] is not merged:
+                merged |= members[root]
+            members[root] = None
+            parent[root] = new_group
+            absorbed[new_group] += absorbed[root]
+        if merged is not item:
+            merged |= item
+        members.append(merged)
+        for protein in item:
+            inverted[protein].append(new_group)
+    res, counts = list(), list()
+    for group, data in enumerate(members):
+        if data is not None and len(data) >= 2:
             res.append(data)
-    return res
+            counts.append(absorbed[group])
+    return (res, counts) if return_counts else res
 
 
 # 去重处理
 # 去重处理需要按照score NA的0.25作为分界
-def remove_duplicate(complexes, targets):
-    af_matrix = [[0 for j in range(len(targets))]for i in range(
-        len(complexes))]
-    for i in range(len(complexes)):
-        for j in range(len(targets)):
-            comp, targ = complexes[i], targets[j]
-            af_matrix[i][j] = pow(len(comp & targ), 2)/(len(comp)*len(targ))
-    res = []
-    for index, comp in enumerate(complexes):
-        if max(af_matrix[index]) >= 0.25:
-            continue
-        res.append(comp)
-    return res
+def remove_duplicate(complexes, targets, threshold=DUPLICATE_THRESHOLD):
+    '''
+    去除与targets中任意一个复合物NA分数不小于threshold的复合物
+    交集大小通过稀疏的关联矩阵乘积(复合物×蛋白质)·(蛋白质×目标)一次得到，
+    只在交集非空的位置计算NA并取行最大值，不生成稠密矩阵
+    :param complexes: 蛋白质id集合的列表或者ComplexSet，返回相同的类型
+    '''
+    comp_set, targ_set = complexset.align(complexes, targets)
+    counts = comp_set.intersection_sizes(targ_set).tocoo()
+    scores = counts.data**2 / \
+        (comp_set.sizes()[counts.row]*targ_set.sizes()[counts.col])
+    row_max = np.zeros(len(comp_set))
+    np.maximum.at(row_max, counts.row, scores)
+    keep = np.flatnonzero(row_max < threshold)
+    if isinstance(complexes, ComplexSet):
+        return comp_set.subset(keep)
+    return [complexes[index] for index in keep]
 
 
 def showsubgraphs(graph, nodelists, path):
     os.makedirs(path, exist_ok=True)
     for index, nodes in enumerate(nodelists):
-        subgraph = nx.subgraph(graph, nodes)
+        subgraph = graph.subgraph(nodes).to_networkx()
         nx.draw(subgraph)
         plt.savefig(path+"/{}".format(index))
         plt.close()
 
 
-def get_singlegraph(biggraph, nodes, direct, label, index):
-    print('processing {}'.format(index))
-    subgraph = biggraph.subgraph(nodes)
-    return single_data(subgraph, direct, label)
+def to_dglgraph(graph: CSRGraph):
+    # 一次性建图，特征从全局矩阵中按索引批量取出
+    src = torch.from_numpy(graph.edge_src().astype(np.int64))
+    dst = torch.from_numpy(graph.neighbors_array.astype(np.int64))
+    res = dgl.graph((src, dst), num_nodes=graph.number_of_nodes())
+    res.ndata['feat'] = torch.as_tensor(
+        graph.node_features(), dtype=torch.float32)
+    res.ndata['degree'] = torch.as_tensor(
+        graph.degree(), dtype=torch.float32).reshape(-1, 1)
+    res.edata['feat'] = torch.as_tensor(
+        graph.edge_features(), dtype=torch.float32)
+    return res
+
+
+def aggregate_features(dglgraph):
+    # 预先计算入边邻居原始特征之和以及入度，模型中的邻居求和与线性映射可以交换顺序
+    # 对批量图同样适用，分块对角的大图上一次计算
+    dglgraph.update_all(fn.copy_u('feat', 'msg'), fn.sum('msg', 'agg_feat'))
+    dglgraph.ndata['in_deg'] = dglgraph.in_degrees().float().reshape(-1, 1)
+    return dglgraph
+
+
+def candidate_dglgraphs(graph: CSRGraph, dglgraph, candidates, aggregate=False):
+    '''
+    分块对角切片，一次取出所有候选的DGLGraph
+    :param graph: 全局CSRGraph
+    :param dglgraph: to_dglgraph(graph)得到的全局DGLGraph，边的编号与CSR中的位置一致
+    :param candidates: 蛋白质id集合的列表
+    :param aggregate: 是否同时保存预先聚合的邻居特征
+    '''
+    batch = graph.block_subgraph(candidates)
+    res = dgl.graph((torch.from_numpy(batch.src.astype(np.int64)), torch.from_numpy(batch.dst.astype(np.int64))),
+                    num_nodes=batch.number_of_nodes())
+    res.ndata['feat'] = dglgraph.ndata['feat'][torch.from_numpy(batch.nodes)]
+    res.ndata['degree'] = (res.in_degrees() +
+                           res.out_degrees()).float().reshape(-1, 1)
+    res.edata['feat'] = dglgraph.edata['feat'][torch.from_numpy(batch.edge_pos)]
+    if aggregate:
+        aggregate_features(res)
+    res.set_batch_num_nodes(torch.from_numpy(batch.sizes()))
+    res.set_batch_num_edges(torch.from_numpy(batch.edge_counts()))
+    graphs = dgl.unbatch(res)
+    # unbatch得到的特征是大图特征的视图，序列化时会带上整块存储，这里复制为独立的张量
+    for graph in graphs:
+        for frame in (graph.ndata, graph.edata):
+            for name in list(frame.keys()):
+                frame[name] = frame[name].clone()
+    return graphs
 
 
 class single_data:
-    def __init__(self, graph, direct, label=None):
+    def __init__(self, graph, direct, label=None, feat=None, aggregate=False):
+        # graph可以是CSRGraph，也可以是已经切片得到的DGLGraph，此时feat必须给出
+        # feat为批量预先计算好的拓扑特征，没有时单独计算
+        # aggregate为True时在图中保存agg_feat和in_deg，供precomputed模式的模型使用
         self.label = label
-        self.graph = self.dgl_graph(graph)
-        self.feat = torch.tensor(self.get_default_feature(
-            graph, direct), dtype=torch.float32).reshape(1, -1)
-
-    def dgl_graph(self, graph: nx.Graph):
-        res = dgl.DGLGraph()
-        nodes = list(graph.nodes)
-        for index, node in enumerate(nodes):
-            data = torch.tensor(
-                graph.nodes[node]['w'], dtype=torch.float32).reshape(1, -1)
-            deg = torch.tensor(graph.degree(
-                node), dtype=torch.float32).reshape(1, -1)
-            res.add_nodes(1, {'feat': data, 'degree': deg})
-            # res.add_edge(index, index)
-        for v0, v1 in graph.edges:
-            data = torch.tensor(
-                graph[v0][v1]['w'], dtype=torch.float32).reshape(1, -1)
-            res.add_edges(nodes.index(v0), nodes.index(v1), {'feat': data})
-        return res
-
-    def get_default_feature(self, graph: nx.Graph, direct):
-        result = []
-        result.append(len(graph.nodes))
-        result.append(nx.density(graph))
-        degrees = nx.degree(graph)
-        degrees = np.array([item[1]for item in degrees])
-        clusters = nx.clustering(graph)
-        clusters = np.array([clusters[item] for item in clusters.keys()])
-        # topologic = nx.topological_sort(graph)
-        result.append(degrees.mean())
-        result.append(degrees.max())
-        result.append(degrees.min())
-        result.append(degrees.var())
-
-        result.append(clusters.mean())
-        result.append(clusters.max())
-        result.append(clusters.var())
-        if direct:
-            # 计算有方向的时候的补充特征
-            pass
-        else:
-            # 计算无向的时候的补充特征
-            correlation = nx.degree_pearson_correlation_coefficient(
-                graph)
-            result.append(correlation if correlation is not np.nan else 0.0)
-        return list(result)
+        self.graph = graph if isinstance(
+            graph, dgl.DGLGraph) else self.dgl_graph(graph)
+        if aggregate and 'agg_feat' not in self.graph.ndata:
+            aggregate_features(self.graph)
+        if feat is None:
+            feat = self.get_default_feature(graph, direct)
+        self.feat = torch.as_tensor(
+            feat, dtype=torch.float32).reshape(1, -1)
+
+    def dgl_graph(self, graph: CSRGraph):
+        return to_dglgraph(graph)
+
+    def get_default_feature(self, graph: CSRGraph, direct):
+        # 节点数，密度，度的均值/最大/最小/方差，聚类系数的均值/最大/方差
+        # 无向图时补充度相关系数
+        return topology.default_features(graph, [graph.ids], direct)[0]
 
 
 def get_global_nxgraph(node_path, edge_path, direct):
     # 获取图数据
-    nodes, nodematrix, edges, edgematrix = read_datas(node_path, edge_path)
+    store = featstore.load_store(node_path, edge_path)
+    nodes, nodematrix = store.ids, store.groups['deepwalk']
     # 归一化处理
     # nodematrix = dataprocess(nodematrix)
-    edgematrix = dataprocess(edgematrix)
+    edgematrix = dataprocess(store.edge_feat)
     nx_graph = nx.DiGraph()
     for index, item in enumerate(nodematrix):
         nx_graph.add_node(nodes[index], w=item)
+    edges = store.edge_index.tolist()
     if direct:
         for index, item in enumerate(edgematrix):
-            nx_graph.add_edge(edges[index][0], edges[index][1], w=item)
+            nx_graph.add_edge(nodes[edges[index][0]],
+                              nodes[edges[index][1]], w=item)
     else:
         for index, item in enumerate(edgematrix):  # 无向图可以这么处理，重复
-            nx_graph.add_edge(edges[index][0], edges[index][1], w=item)
-            nx_graph.add_edge(edges[index][1], edges[index][0], w=item)
+            nx_graph.add_edge(nodes[edges[index][0]],
+                              nodes[edges[index][1]], w=item)
+            nx_graph.add_edge(nodes[edges[index][1]],
+                              nodes[edges[index][0]], w=item)
     return nx_graph
 
 
-def first_stage(node_path, edge_path, postive_path, middle_path, save_path, reload=True, direct=False):
-    if not reload and os.path.exists(save_path):
-        with open(save_path, 'rb')as f:
-            result = pickle.load(f)
-        return result
+def get_global_graph(node_path, edge_path, direct):
+    # CSR格式的全局图，节点特征直接使用内存映射的矩阵
+    store = featstore.load_store(node_path, edge_path)
+    edgematrix = dataprocess(store.edge_feat)
+    return CSRGraph.from_edges(store.ids, store.edge_index[:, 0], store.edge_index[:, 1],
+                               store.groups['deepwalk'], edgematrix, direct)
+
+
+def get_cache(save_path):
+    # 所有阶段的产物按照内容寻址存放在save_path所在目录的cache下
+    return cache.ArtifactCache(os.path.join(os.path.dirname(save_path), 'cache'))
+
+
+def cache_stage(stage, save_path):
+    # 每个阶段对每个save_path只保留最新的一份，同一目录下不同save_path(例如compare下的各个方法)互不淘汰
+    return '{}_{}'.format(stage, os.path.splitext(os.path.basename(save_path))[0])
+
+
+def get_code_version():
+    return cache.code_version([sys.modules[__name__], featstore, csrgraph, topology, sampler, complexset])
+
+
+def first_stage_candidates(node_path, edge_path, postive_path, middle_path, direct):
     '''
     下面是读取点数据，和边数据，并做特征初始化处理
     '''
-    nx_graph = get_global_nxgraph(node_path, edge_path, direct)
-    # dgl_graph = single_data(nx_graph, direct).graph
-    bench_data = read_bench(postive_path)
-    middle_data = read_bench(middle_path)
+    global_graph = get_global_graph(node_path, edge_path, direct)
+    # dgl_graph = single_data(global_graph, direct).graph
+    # 复合物统一使用以全局图节点顺序编号的ComplexSet
+    protein_index = complexset.ProteinIndex(global_graph.ids)
+    bench_data = read_bench(postive_path, protein_index)
+    middle_data = read_bench(middle_path, protein_index)
     random_target = (len(bench_data)+len(middle_data))  # 先多取一些，再截取需要的部分
     random_data = get_random_graphs(
-        nx_graph, [len(item) for item in bench_data + middle_data], random_target)  # TODO 设定随机的数目
+        global_graph, (bench_data + middle_data).sizes().tolist(), random_target)  # TODO 设定随机的数目
+    random_data = ComplexSet.from_sets(random_data, protein_index)
 
     # TODO 这里的处理对不对，是不是从逻辑上来说就不应该出现子图以及合并的情况
     # 接下来需要提取真正的graph，找出所有的subgraph
-    bench_data = subgraphs(bench_data, nx_graph)
-    middle_data = subgraphs(middle_data, nx_graph)
+    bench_data = subgraphs(bench_data, global_graph)
+    middle_data = subgraphs(middle_data, global_graph)
     # 接下来归并处理
     bench_data = merged_data(bench_data)  # 621->555
     middle_data = merged_data(middle_data)  # 888->416
@@ -290,71 +370,145 @@ def first_stage(node_path, edge_path, postive_path, middle_path, save_path, relo
     middle_data = remove_duplicate(middle_data, bench_data)
     random_data = remove_duplicate(random_data, bench_data+middle_data)
     # 存储图片
-    # showsubgraphs(nx_graph, bench_data, "Data/Yeast/pictures/bench")
-    # showsubgraphs(nx_graph, middle_data, "Data/Yeast/pictures/middle")
-    # showsubgraphs(nx_graph, random_data, "Data/Yeast/pictures/random")
+    # showsubgraphs(global_graph, bench_data, "Data/Yeast/pictures/bench")
+    # showsubgraphs(global_graph, middle_data, "Data/Yeast/pictures/middle")
+    # showsubgraphs(global_graph, random_data, "Data/Yeast/pictures/random")
     # 整理成数据集
     all_datas = []
-    all_datas.extend([item, 0] for item in bench_data)
-    all_datas.extend([item, 1] for item in middle_data)
-    all_datas.extend([item, 2] for item in random_data)
-    # 多进程处理
-    multi_res = []
-    pool = mtp.Pool(processes=10)
-    # TODO 目前调试流程只选取500个
-    for index, (item, label) in enumerate(all_datas):
-        multi_res.append(pool.apply_async(
-            get_singlegraph, args=(nx_graph, item, direct, label, index)))
-    pool.close()
-    pool.join()
-    datasets = [item.get() for item in multi_res]
-
-    with open(save_path, 'wb') as f:
-        pickle.dump(datasets, f)
+    all_datas.extend([item, 0] for item in bench_data.to_sets())
+    all_datas.extend([item, 1] for item in middle_data.to_sets())
+    all_datas.extend([item, 2] for item in random_data.to_sets())
+    return all_datas
+
+
+# 子进程中的全局图，每个进程只在初始化时接收一次
+_worker_graph = None
+_worker_dglgraph = None
+
+
+def init_worker(graph, dglgraph):
+    global _worker_graph, _worker_dglgraph
+    _worker_graph = graph
+    _worker_dglgraph = dglgraph
+    torch.set_num_threads(1)  # 并行由进程池负责，避免线程数超额
+
+
+def worker_convert(task):
+    # 每个任务是一块候选，在全局DGLGraph上一次切片
+    items, labels, feats, direct, aggregate, start = task
+    print('processing {}-{}'.format(start, start+len(items)-1))
+    graphs = candidate_dglgraphs(
+        _worker_graph, _worker_dglgraph, items, aggregate)
+    return [single_data(graph, direct, label, feat) for graph, label, feat in zip(graphs, labels, feats)]
+
+
+def iter_convert_candidates(node_path, edge_path, all_datas, direct, processes=10, chunk_size=STREAM_CHUNK_SIZE, aggregate=False):
+    '''
+    按块转换候选，每次产出chunk_size个，内存占用与候选总数无关
+    :param all_datas: [蛋白质id集合, label]的可迭代对象，可以是生成器
+    :param aggregate: 是否在数据集中保存预先聚合的邻居特征
+    :return: 生成器，每次产出(该块的[蛋白质id集合, label]列表, 对应的single_data列表)
+    '''
+    global_graph = get_global_graph(node_path, edge_path, direct)
+    global_dglgraph = to_dglgraph(global_graph)
+    # 多进程处理，fork时全局图直接写时复制继承，spawn时每个进程只反序列化一次
+    # 任务按块分发，每个任务在全局DGLGraph上切出一块候选
+    pool = mtp.Pool(processes=processes, initializer=init_worker,
+                    initargs=(global_graph, global_dglgraph))
+    try:
+        all_datas = iter(all_datas)
+        start = 0
+        while True:
+            chunk = list(itertools.islice(all_datas, chunk_size))
+            if not chunk:
+                break
+            # 拓扑特征在主进程中对整块候选一次性计算
+            feats = topology.default_features(
+                global_graph, [item for item, _ in chunk], direct)
+            task_size = max(1, len(chunk)//(processes*4))
+            tasks = [([item for item, _ in chunk[index:index+task_size]], [label for _, label in chunk[index:index+task_size]],
+                      feats[index:index+task_size], direct, aggregate, start+index)
+                     for index in range(0, len(chunk), task_size)]
+            yield chunk, [item for res in pool.map(worker_convert, tasks) for item in res]
+            start += len(chunk)
+    finally:
+        # 结果都已经取回，消费方提前结束时也能回收子进程
+        pool.terminate()
+        pool.join()
+
+
+def convert_candidates(node_path, edge_path, all_datas, direct, processes=10, aggregate=False):
+    datasets = []
+    for _, chunk_datasets in iter_convert_candidates(node_path, edge_path, all_datas, direct, processes, aggregate=aggregate):
+        datasets.extend(chunk_datasets)
     return datasets
 
 
-def second_stage(node_path, edge_path, candi_data, save_path, reload=True, direct=False):
-    if not reload and os.path.exists(save_path):
-        with open(save_path, 'rb')as f:
-            result = pickle.load(f)
-        return result
-    nx_graph = get_global_nxgraph(node_path, edge_path, direct)
-    # datasets = [get_singlegraph(nx_graph, item, direct, -1)
-    #             for item in candi_data]  # -1代表无意义
-    # TODO 注意那就不需要考虑不连通的情况，因为这是在我给定的图里面获取的
-    # return datasets
-    multi_res = []
-    pool = mtp.Pool(processes=10)
-    for index, item in enumerate(candi_data):
-        multi_res.append(pool.apply_async(
-            get_singlegraph, args=(nx_graph, item, direct, -1, index)))
-    pool.close()
-    pool.join()
-    datasets = [item.get() for item in multi_res]
-    with open(save_path, 'wb') as f:
-        pickle.dump(datasets, f)
+def first_stage(node_path, edge_path, postive_path, middle_path, save_path, reload=True, direct=False, aggregate=False):
+    '''
+    生成第一阶段的训练数据，中间结果按内容寻址缓存
+    :param save_path: 只使用它所在的目录和文件名，缓存写在该目录的cache下，不再写入save_path本身
+    :param reload: 为True时强制重新计算，否则只重新计算失效的阶段
+    '''
+    artifacts = get_cache(save_path)
+    code = get_code_version()
+    # 随机子图依赖于当前的随机状态，命中时恢复计算之后的随机状态，保证后续流程一致
+    candi_key = cache.make_key([node_path, edge_path, postive_path, middle_path],
+                               {'direct': direct, 'merge': MERGE_THRESHOLD, 'duplicate': DUPLICATE_THRESHOLD,
+                                'random_state': random.getstate()}, code)
+    # reload时不读取缓存，避免白白反序列化
+    hit, result = artifacts.load(
+        cache_stage('candidates', save_path), candi_key) if not reload else (False, None)
+    if hit:
+        all_datas, random_state = result
+        random.setstate(random_state)
+    else:
+        all_datas = first_stage_candidates(
+            node_path, edge_path, postive_path, middle_path, direct)
+        artifacts.save(cache_stage('candidates', save_path),
+                       candi_key, (all_datas, random.getstate()))
+
+    data_key = cache.make_key([node_path, edge_path],
+                              {'direct': direct, 'candidates': cache.complexes_digest(item for item, _ in all_datas),
+                               'labels': [label for _, label in all_datas], 'aggregate': aggregate}, code)
+    hit, datasets = artifacts.load(
+        cache_stage('first_stage', save_path), data_key) if not reload else (False, None)
+    if not hit:
+        datasets = convert_candidates(
+            node_path, edge_path, all_datas, direct, aggregate=aggregate)
+        artifacts.save(cache_stage('first_stage', save_path), data_key, datasets)
     return datasets
 
 
-class BatchGenerator():
-    def __init__(self, data, batch_size):
-        self.data = data
-        random.shuffle(self.data)
-        self.batch_size = batch_size if batch_size != -1 else len(self.data)
-        self.index = 0
+def iter_second_stage(node_path, edge_path, candi_data, direct=False, chunk_size=STREAM_CHUNK_SIZE, aggregate=False):
+    # second_stage的流式版本，不缓存，每次产出(候选列表, single_data列表)
+    for chunk, datasets in iter_convert_candidates(node_path, edge_path, ([item, -1] for item in candi_data),
+                                                   direct, chunk_size=chunk_size, aggregate=aggregate):
+        yield [item for item, _ in chunk], datasets
 
-    def __iter__(self):
-        return self
 
-    def __next__(self):
-        try:
-            self.data[self.index+self.batch_size-1]  # 用于检查是否越界
-            b_data = self.data[self.index:self.index+self.batch_size]
-        except IndexError:
-            raise StopIteration()
-        self.index += self.batch_size
-        return b_data
+def second_stage(node_path, edge_path, candi_data, save_path, reload=True, direct=False, aggregate=False):
+    '''
+    候选复合物转换为模型的输入，结果按内容寻址缓存
+    :param save_path: 只使用它所在的目录和文件名，缓存写在该目录的cache下，不再写入save_path本身
+    :param reload: 为True时强制重新计算
+    '''
+    artifacts = get_cache(save_path)
+    data_key = cache.make_key([node_path, edge_path],
+                              {'direct': direct, 'candidates': cache.complexes_digest(candi_data),
+                               'aggregate': aggregate}, get_code_version())
+    if not reload:
+        hit, datasets = artifacts.load(cache_stage('second_stage', save_path), data_key)
+        if hit:
+            return datasets
+    # datasets = [get_singlegraph(global_graph, item, direct, -1)
+    #             for item in candi_data]  # -1代表无意义
+    # TODO 注意那就不需要考虑不连通的情况，因为这是在我给定的图里面获取的
+    # return datasets
+    datasets = convert_candidates(
+        node_path, edge_path, [[item, -1] for item in candi_data], direct, aggregate=aggregate)
+    artifacts.save(cache_stage('second_stage', save_path), data_key, datasets)
+    return datasets
 
 
 if __name__ == "__main__":
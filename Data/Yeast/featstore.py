@@ -0,0 +1,106 @@
+import os
+import json
+import numpy as np
+
+
+# 节点特征按照表头中的关键字分组存储
+FEATURE_GROUPS = ('blast', 'deepwalk')
+
+
+def default_store_path(node_path):
+    return node_path + '_store'
+
+
+def _source_info(path):
+    stat = os.stat(path)
+    return [os.path.abspath(path), stat.st_size, stat.st_mtime]
+
+
+def _group_slices(nodefeat_names):
+    # 与原来read_datas的处理保持一致：按照表头下标在特征向量上取[min, max+1)
+    slices = {}
+    for group in FEATURE_GROUPS:
+        index_group = [index for index, name in enumerate(
+            nodefeat_names) if group in name]
+        if index_group:
+            slices[group] = (min(index_group), max(index_group)+1)
+    return slices
+
+
+def build_store(node_path, edge_path, store_path):
+    '''
+    将文本格式的dip_node/dip_edge一次性转换为二进制存储
+    :param node_path: 节点特征文件，第一行为表头
+    :param edge_path: 边特征文件，第一行为表头
+    :param store_path: 存储目录
+    '''
+    ids = []
+    with open(node_path, 'r') as f:
+        nodefeat_names = next(f).strip().split('\t')
+        slices = _group_slices(nodefeat_names)
+        rows = []
+        for nodedata in f:
+            nodedata_splited = nodedata.strip().split('\t')
+            ids.append(nodedata_splited[0])
+            rows.append(nodedata_splited[1:])
+    nodematrix = np.array(rows, dtype=np.float32).reshape(len(ids), -1)
+    id_index = {node: index for index, node in enumerate(ids)}
+
+    edge_index, edgematrix = [], []
+    with open(edge_path, 'r') as f:
+        next(f)
+        for edgedata in f:
+            edgedata_splited = edgedata.strip().split('\t')
+            v0, v1 = edgedata_splited[0].split(' ')
+            if v0 not in id_index or v1 not in id_index:
+                raise ValueError(
+                    'edge {} {} refers to a node without features'.format(v0, v1))
+            edge_index.append([id_index[v0], id_index[v1]])
+            edgematrix.append(edgedata_splited[1:])
+    edge_index = np.array(edge_index, dtype=np.int32).reshape(-1, 2)
+    edgematrix = np.array(edgematrix, dtype=np.float32).reshape(
+        len(edge_index), -1)
+
+    os.makedirs(store_path, exist_ok=True)
+    np.save(os.path.join(store_path, 'ids.npy'), np.array(ids))
+    for group, (start, end) in slices.items():
+        np.save(os.path.join(store_path, 'node_{}.npy'.format(group)),
+                np.ascontiguousarray(nodematrix[:, start:end]))
+    np.save(os.path.join(store_path, 'edge_index.npy'), edge_index)
+    np.save(os.path.join(store_path, 'edge_feat.npy'), edgematrix)
+    # meta最后写入，中途失败的存储不会被当成有效存储
+    meta = {'node': _source_info(node_path), 'edge': _source_info(edge_path),
+            'groups': list(slices.keys())}
+    with open(os.path.join(store_path, 'meta.json'), 'w') as f:
+        json.dump(meta, f)
+
+
+def _store_valid(node_path, edge_path, store_path):
+    meta_path = os.path.join(store_path, 'meta.json')
+    if not os.path.exists(meta_path):
+        return False
+    with open(meta_path, 'r') as f:
+        meta = json.load(f)
+    return meta['node'] == _source_info(node_path) and meta['edge'] == _source_info(edge_path)
+
+
+class FeatureStore():
+    def __init__(self, store_path):
+        with open(os.path.join(store_path, 'meta.json'), 'r') as f:
+            meta = json.load(f)
+        self.ids = np.load(os.path.join(store_path, 'ids.npy')).tolist()
+        # 特征矩阵均以只读的方式映射，多个进程共享同一份页缓存
+        self.groups = {group: np.load(os.path.join(store_path, 'node_{}.npy'.format(group)), mmap_mode='r')
+                       for group in meta['groups']}
+        self.edge_index = np.load(os.path.join(
+            store_path, 'edge_index.npy'), mmap_mode='r')
+        self.edge_feat = np.load(os.path.join(
+            store_path, 'edge_feat.npy'), mmap_mode='r')
+
+
+def load_store(node_path, edge_path, store_path=None):
+    # 源文件发生变化时重新转换
+    store_path = store_path or default_store_path(node_path)
+    if not _store_valid(node_path, edge_path, store_path):
+        build_store(node_path, edge_path, store_path)
+    return FeatureStore(store_path)
@@ -0,0 +1,111 @@
+import random
+import numpy as np
+
+
+class AliasTable():
+    '''
+    按权重抽样的alias表，建表O(n)，每次抽样O(1)
+    :param weights: 非负权重，至少有一个为正
+    '''
+
+    def __init__(self, weights):
+        weights = np.asarray(weights, dtype=np.float64)
+        num = len(weights)
+        scaled = weights*num/weights.sum()
+        self.prob = np.ones(num)
+        self.alias = np.arange(num)
+        small = [i for i in range(num) if scaled[i] < 1.0]
+        large = [i for i in range(num) if scaled[i] >= 1.0]
+        while small and large:
+            less, more = small.pop(), large.pop()
+            self.prob[less] = scaled[less]
+            self.alias[less] = more
+            scaled[more] -= 1.0 - scaled[less]
+            (small if scaled[more] < 1.0 else large).append(more)
+        self.prob = self.prob.tolist()
+        self.alias = self.alias.tolist()
+
+    def draw(self, rng=random):
+        index = int(rng.random()*len(self.prob))
+        return index if rng.random() < self.prob[index] else self.alias[index]
+
+
+class RandomGraphSampler():
+    '''
+    随机子图生成器，每个全局图只构建一次，之后可以反复抽样
+    与get_single_random_graph_nodes原来的抽样过程分布一致：
+    起点按度数加权选取，之后每接受一个点，候选中已有的点权重乘10，新加入的点权重为1，
+    因此第a次接受时加入的候选在第acc次接受之后的权重为10^(acc-a)，同一批加入的候选权重相同，
+    按批保存候选即可，先按批的总权重选批，再在批内均匀选取
+    :param graph: 全局CSRGraph，有向图当成无向图处理
+    '''
+
+    def __init__(self, graph):
+        self.graph = graph
+        self.degrees = graph.degree()
+        self.start_table = AliasTable(self.degrees)
+        if graph.directed:  # 预先合并出边和入边
+            adj = graph.adjacency()
+            undirected = ((adj + adj.T) > 0).tocsr()
+            undirected.sort_indices()
+            offsets, neighbors = undirected.indptr, undirected.indices
+        else:
+            offsets, neighbors = graph.offsets, graph.neighbors_array
+        self.neighbor_lists = [neighbors[offsets[i]:offsets[i+1]].tolist()
+                               for i in range(graph.number_of_nodes())]
+
+    def sample_index(self, size, rng=random):
+        # 返回被选中节点的位置编号
+        beginer = self.start_table.draw(rng)
+        node_set = set([beginer])
+        batches = [list(self.neighbor_lists[beginer])]  # 每一批候选及其加入时的接受次数
+        epochs = [0]
+        skipped = []  # 被跳过的候选在下一次接受时以权重1重新加入
+        accepted = 0
+        max_weight = 1
+        while len(node_set) < size and batches:
+            weights = [len(batch)*10**(accepted-epoch)
+                       for batch, epoch in zip(batches, epochs)]
+            target = rng.random()*sum(weights)
+            which = 0
+            while which < len(batches)-1 and target >= weights[which]:
+                target -= weights[which]
+                which += 1
+            batch = batches[which]
+            pos = int(rng.random()*len(batch))
+            batch[pos], batch[-1] = batch[-1], batch[pos]
+            next_node = batch.pop()
+            the_weight = 10**(accepted-epochs[which])
+            if not batch:
+                batches.pop(which)
+                epochs.pop(which)
+            max_weight = max(max_weight, the_weight)
+
+            if (the_weight == 1 and max_weight >= 100) or (the_weight == 10 and max_weight >= 10000):  # 密集子图之后不应该再出现低权重图
+                skipped.append(next_node)
+                continue
+
+            node_set.add(next_node)
+            accepted += 1
+            # 原来的实现中每次扩展的都是起点的邻居，仍在候选中的权重乘10，其余不在子图中的重新加入
+            if skipped:
+                batches.append(skipped)
+                epochs.append(accepted)
+                skipped = []
+        return node_set
+
+    def sample(self, size, rng=random):
+        node_list = list(self.sample_index(size, rng))
+        # 最后还需要在子图里面去除1/4的度小的节点
+        index = sorted(node_list)
+        sub_degrees = dict(
+            zip(index, self.graph.subgraph_by_index(index).degree().tolist()))
+        remove_num_direct = min(len(node_list)//4, 6)  # 也不能去除太多了，最多去除6个
+        meandegree = sum(sub_degrees.values())/len(sub_degrees)
+        sitems = sorted(((node, sub_degrees[node])
+                         for node in node_list), key=lambda i: i[1])
+        res = set()
+        for item in sitems[remove_num_direct:]:
+            if item[1] > int(meandegree/2):  # 按照平均度数再减去一部分
+                res.add(self.graph.ids[item[0]])
+        return res
@@ -0,0 +1,103 @@
+import numpy as np
+import torch
+from scipy import sparse
+
+
+# 每次处理的候选数目，控制分块对角矩阵的大小
+CHUNK_SIZE = 4096
+
+
+def _segment_sum(values, segment, num):
+    return np.bincount(segment, weights=values, minlength=num)
+
+
+def _segment_extreme(values, offsets, func):
+    # 空的候选结果为0
+    res = np.zeros(len(offsets)-1)
+    nonempty = offsets[:-1] < offsets[1:]
+    if nonempty.any():
+        res[nonempty] = func.reduceat(values, offsets[:-1][nonempty])
+    return res
+
+
+def _segment_stats(values, offsets, segment, sizes):
+    num = len(sizes)
+    safe_sizes = np.maximum(sizes, 1)
+    mean = _segment_sum(values, segment, num)/safe_sizes
+    var = _segment_sum((values-mean[segment])**2, segment, num)/safe_sizes
+    return mean, _segment_extreme(values, offsets, np.maximum), _segment_extreme(values, offsets, np.minimum), var
+
+
+def _batch_features(batch, direct):
+    num, total = batch.number_of_candidates(), batch.number_of_nodes()
+    sizes = batch.sizes().astype(np.float64)
+    segment = batch.node_segment()
+    offsets = batch.node_offsets
+    src, dst = batch.src, batch.dst
+
+    # 边数与密度，与nx.density一致，有向图m/(n(n-1))
+    edge_counts = batch.edge_counts().astype(np.float64)
+    density = np.zeros(num)
+    multi = sizes > 1
+    density[multi] = edge_counts[multi]/(sizes[multi]*(sizes[multi]-1))
+
+    # 度为入度与出度之和，与nx.DiGraph的degree一致
+    out_degree = np.bincount(src, minlength=total).astype(np.float64)
+    in_degree = np.bincount(dst, minlength=total).astype(np.float64)
+    degree_mean, degree_max, degree_min, degree_var = _segment_stats(
+        out_degree+in_degree, offsets, segment, sizes)
+
+    # 有向聚类系数，与nx.clustering在有向图上的定义一致：
+    # t_i = (S^3)_ii，S = A + A^T，分母为2*(d_i(d_i-1) - 2*d_i^<->)
+    loop = src == dst
+    adj = sparse.csr_matrix((np.ones(int((~loop).sum())), (src[~loop], dst[~loop])),
+                            shape=(total, total))
+    sym = adj + adj.T
+    triangles = np.asarray((sym @ sym).multiply(sym).sum(1)).ravel()
+    total_degree = np.asarray(adj.sum(1)).ravel() + \
+        np.asarray(adj.sum(0)).ravel()
+    bidirect_degree = np.asarray(adj.multiply(adj.T).sum(1)).ravel()
+    denom = 2*(total_degree*(total_degree-1) - 2*bidirect_degree)
+    clusters = np.zeros(total)
+    positive = triangles > 0
+    clusters[positive] = triangles[positive]/denom[positive]
+    cluster_mean, cluster_max, _, cluster_var = _segment_stats(
+        clusters, offsets, segment, sizes)
+
+    result = [sizes, density, degree_mean, degree_max, degree_min, degree_var,
+              cluster_mean, cluster_max, cluster_var]
+    if not direct:
+        # 度相关系数，与nx.degree_pearson_correlation_coefficient一致：
+        # 每条边(u, v)取(u的出度, v的入度)求皮尔逊相关系数，没有定义时取0
+        edge_segment = segment[src]
+        x, y = out_degree[src], in_degree[dst]
+        safe_counts = np.maximum(edge_counts, 1)
+        x = x - (_segment_sum(x, edge_segment, num)/safe_counts)[edge_segment]
+        y = y - (_segment_sum(y, edge_segment, num)/safe_counts)[edge_segment]
+        cov = _segment_sum(x*y, edge_segment, num)
+        scale = np.sqrt(_segment_sum(x*x, edge_segment, num)
+                        * _segment_sum(y*y, edge_segment, num))
+        correlation = np.zeros(num)
+        defined = scale > 0
+        correlation[defined] = np.clip(
+            cov[defined]/scale[defined], -1.0, 1.0)
+        result.append(correlation)
+    return np.stack(result, 1)
+
+
+def default_features(graph, candidates, direct, chunk_size=CHUNK_SIZE):
+    '''
+    批量计算候选复合物的拓扑特征，与single_data原来逐个子图的计算结果一致
+    边界情况与原来不同：没有边的子图原来在度相关系数处出错，只有一条边等相关系数没有定义时原来得到nan
+    (correlation is not np.nan的判断不起作用)，这里都取0
+    :param graph: 全局CSRGraph
+    :param candidates: 蛋白质id集合的列表
+    :param direct: 无向图时额外计算度相关系数
+    :return: [候选数目, 10]的tensor，有向图时为9维
+    '''
+    candidates = list(candidates)
+    chunks = [_batch_features(graph.block_subgraph(candidates[start:start+chunk_size]), direct)
+              for start in range(0, len(candidates), chunk_size)]
+    if not chunks:
+        return torch.zeros(0, 9 if direct else 10)
+    return torch.tensor(np.concatenate(chunks), dtype=torch.float32)
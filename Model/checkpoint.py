@@ -0,0 +1,131 @@
+import os
+import json
+import queue
+import threading
+import torch
+
+
+MANIFEST = 'manifest.json'
+BEST = 'best.pt'
+
+
+class CheckpointManager():
+    '''
+    训练过程中的模型保存：torch.save在后台线程中执行，不阻塞训练；记录验证分数最好的模型，
+    超过patience个epoch没有提升时提示提前停止；所有保存的文件和分数记录在manifest.json中
+    :param path: 保存的目录
+    :param mode: 'max'表示分数越大越好，'min'表示越小越好（例如验证损失）
+    :param patience: 多少个epoch没有提升时停止，None表示不提前停止
+    '''
+
+    def __init__(self, path, mode='max', patience=None):
+        self.path = path
+        self.mode = mode
+        self.patience = patience
+        self.manifest = {'mode': mode, 'checkpoints': {}, 'scores': {},
+                         'best_epoch': None, 'best_score': None, 'best': None, 'stopped_epoch': None}
+        self.jobs = queue.Queue()
+        self.error = None
+        self.written = False  # 是否写过manifest.json
+        self.worker = threading.Thread(target=self._write, daemon=True)
+        self.worker.start()
+
+    def _write(self):
+        while True:
+            job = self.jobs.get()
+            try:
+                if job is None:
+                    return
+                job()
+            except Exception as error:  # 写入失败时在主线程中抛出
+                self.error = error
+            finally:
+                self.jobs.task_done()
+
+    def _submit(self, job):
+        if self.error is not None:
+            raise self.error
+        self.jobs.put(job)
+
+    def _save_state(self, model, filename):
+        # 参数在主线程中复制一份，之后的训练不会影响正在写入的内容
+        state = {key: value.detach().clone()
+                 for key, value in model.state_dict().items()}
+        target = os.path.join(self.path, filename)
+
+        def job():
+            os.makedirs(self.path, exist_ok=True)
+            tmp = target+'.tmp'
+            torch.save(state, tmp)
+            os.replace(tmp, target)
+        self._submit(job)
+
+    def _save_manifest(self):
+        manifest = json.loads(json.dumps(self.manifest))
+        target = os.path.join(self.path, MANIFEST)
+        self.written = True
+
+        def job():
+            os.makedirs(self.path, exist_ok=True)
+            with open(target+'.tmp', 'w') as f:
+                json.dump(manifest, f, indent=2)
+            os.replace(target+'.tmp', target)
+        self._submit(job)
+
+    def save(self, epoch, model):
+        # 按epoch保存，文件名与原来一致
+        filename = '{}.pt'.format(epoch)
+        self._save_state(model, filename)
+        self.manifest['checkpoints'][str(epoch)] = filename
+        self._save_manifest()
+
+    def better(self, score):
+        best = self.manifest['best_score']
+        if best is None:
+            return True
+        return score > best if self.mode == 'max' else score < best
+
+    def record(self, epoch, score, model):
+        '''
+        记录一次验证的分数，分数提升时保存为best.pt
+        :return: 是否应该提前停止
+        '''
+        score = float(score)
+        self.manifest['scores'][str(epoch)] = score
+        if self.better(score):
+            self.manifest.update(best_epoch=epoch, best_score=score, best=BEST)
+            self._save_state(model, BEST)
+        stop = self.patience is not None and epoch - \
+            self.manifest['best_epoch'] >= self.patience
+        if stop:
+            self.manifest['stopped_epoch'] = epoch
+        self._save_manifest()
+        return stop
+
+    def close(self):
+        # 等待所有文件写完，返回最好的模型的路径，没有保存或记录过任何模型时(例如epoch=0)返回None
+        self.jobs.put(None)
+        self.worker.join()
+        if self.error is not None:
+            raise self.error
+        return self.best_path() if self.written else None
+
+    def best_path(self):
+        return best_path(self.path)
+
+
+def best_path(path):
+    '''
+    根据manifest.json找到最好的模型，没有验证分数时取最后保存的模型，没有manifest.json时返回None
+    :param path: CheckpointManager保存的目录
+    '''
+    if not os.path.exists(os.path.join(path, MANIFEST)):
+        return None
+    with open(os.path.join(path, MANIFEST)) as f:
+        manifest = json.load(f)
+    if manifest['best'] is not None:
+        return os.path.join(path, manifest['best'])
+    if not manifest['checkpoints']:
+        raise FileNotFoundError('no checkpoint in {}'.format(path))
+    last = max(manifest['checkpoints'], key=int)
+    return os.path.join(path, manifest['checkpoints'][last])
@@ -0,0 +1,102 @@
+import os
+import copy
+import random
+import socket
+import torch
+import torch.distributed as dist
+import torch.multiprocessing as mp
+from torch.nn.parallel import DistributedDataParallel
+from Model import model as trainer
+from Model import checkpoint
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def train_worker(rank, world_size, port, model, datas, vals, batchsize, path, epoch, regression, seed, val_every, patience):
+    os.environ['MASTER_ADDR'] = '127.0.0.1'
+    os.environ['MASTER_PORT'] = str(port)
+    dist.init_process_group('gloo', rank=rank, world_size=world_size)
+    torch.set_num_threads(max(1, (os.cpu_count() or 1)//world_size))
+    try:
+        # spawn传入的tensor放在共享内存中，每个进程需要自己的一份参数，否则各个进程的更新会叠加
+        model = copy.deepcopy(model)
+        # 模型中有不参与预测的参数(边特征的映射、没有用到的预测层)，需要find_unused_parameters
+        ddp_model = DistributedDataParallel(model, find_unused_parameters=True)
+        # 所有进程使用同一个seed打乱，排列与单进程训练的get_loader一致，
+        # 同一步中所有进程的批次合起来正好是单进程时的一个批次
+        loader = trainer.get_loader(datas, batchsize//world_size, shuffle=True, drop_last=True,
+                                    seed=seed, num_replicas=world_size, rank=rank)
+        if regression:
+            cross_loss = torch.nn.MSELoss(reduction='sum')
+        else:
+            cross_loss = torch.nn.CrossEntropyLoss(
+                weight=torch.FloatTensor([1, 1, 1]), reduction='sum')
+        optimizer = torch.optim.Adam(ddp_model.parameters(), lr=0.0001)
+        # 只有0号进程验证和保存模型
+        checkpoints = checkpoint.CheckpointManager(
+            path, 'min' if regression else 'max', patience) if rank == 0 else None
+        ddp_model.train()
+        for i in range(1, epoch+1):
+            loader.sampler.set_epoch(i)
+            epoch_loss = torch.zeros(1)
+            for graphs, feats, label in loader:
+                predict = ddp_model(graphs, feats)
+                target = label.float().reshape(-1, 1) if regression else label
+                batch_loss = cross_loss(predict, target)
+                optimizer.zero_grad()
+                # DDP对梯度求平均，乘以进程数之后与单进程时整个批次的损失之和一致
+                (batch_loss*world_size).backward()
+                optimizer.step()
+                epoch_loss += batch_loss.detach()
+            dist.all_reduce(epoch_loss)
+            if rank == 0 and i % 5 == 0:
+                checkpoints.save(i, model)
+
+            if i % val_every and i != epoch:
+                if rank == 0:
+                    print('epoch {} loss:'.format(i),
+                          epoch_loss.item() / len(datas))
+                continue
+            stop = torch.zeros(1, dtype=torch.int64)
+            if rank == 0:
+                val_loss, val_metrix, val_classes = trainer.evaluate(
+                    model, vals, cross_loss, regression, batchsize)
+                print('epoch {} loss:'.format(i), epoch_loss.item() / len(datas),
+                      'val loss:', val_loss,
+                      'val metrix:', val_metrix, 'val classes:', val_classes)
+                stop[0] = checkpoints.record(
+                    i, val_loss if regression else val_metrix, model)
+            dist.broadcast(stop, 0)
+            if stop.item():
+                if rank == 0:
+                    print('early stop at epoch {}'.format(i))
+                break
+        if rank == 0:
+            checkpoints.close()
+    finally:
+        dist.destroy_process_group()
+
+
+def train_distributed(model, datas, vals, batchsize, path, epoch, world_size, regression=False, seed=None, val_every=1, patience=None):
+    '''
+    多进程数据并行训练，gloo后端，只使用CPU
+    :param model: graph_classify中的模型，每个进程得到一份相同的初始参数
+    :param batchsize: 所有进程合起来的批次大小，需要是world_size的倍数，每个进程处理batchsize//world_size个
+    :param regression: 是否按train_regression的方式训练，否则按train的方式
+    :param seed: 打乱数据的种子，为None时从全局random中取；相同seed下结果与train/train_regression在误差范围内一致
+    :return: 验证集上最好的模型的路径，没有保存任何模型时为None，训练之后的参数不会写回传入的model
+    '''
+    if batchsize % world_size:
+        raise ValueError('batchsize must be a multiple of world_size')
+    seed = random.getrandbits(63) if seed is None else seed
+    mp.spawn(train_worker, args=(world_size, free_port(), model, datas, vals, batchsize, path, epoch,
+                                 regression, seed, val_every, patience), nprocs=world_size, join=True)
+    return checkpoint.best_path(path)
+
+
+if __name__ == '__main__':
+    pass
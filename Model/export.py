@@ -0,0 +1,146 @@
+from torch import nn
+import torch
+import torch.nn.functional as F
+
+
+class ScriptedModel(nn.Module):
+    '''
+    graph_classify中模型的纯tensor版本，消息传递用index_add_实现，可以直接torch.jit.script
+    与原模型的计算一致：节点特征线性映射，入边邻居求和，gcn_layers层共享权重的GCN，按图求平均再加上基础特征
+    边特征在原模型的预测中没有用到，这里也不需要
+    :param use_graph: 是否使用图的部分
+    :param use_base: 是否使用基础特征
+    :param soft: 分类模型最后做softmax，回归模型不做
+    '''
+    use_graph: torch.jit.Final[bool]
+    use_base: torch.jit.Final[bool]
+    soft: torch.jit.Final[bool]
+    gcn_layers: torch.jit.Final[int]
+
+    def __init__(self, nodefeatsize, graphfeatsize, hidden_size, gcn_layers, head_sizes, use_graph, use_base, soft):
+        super().__init__()
+        self.use_graph = use_graph
+        self.use_base = use_base
+        self.soft = soft
+        self.gcn_layers = gcn_layers
+        self.node_init = nn.Linear(nodefeatsize, hidden_size)
+        self.graph_init = nn.Linear(graphfeatsize, hidden_size)
+        self.gcn_weight = nn.Linear(hidden_size, hidden_size)
+        self.readout = nn.Linear(hidden_size*(gcn_layers+1), hidden_size)
+        self.head_0 = nn.Linear(head_sizes[0], head_sizes[1])
+        self.head_1 = nn.Linear(head_sizes[1], head_sizes[2]) if len(
+            head_sizes) > 2 else nn.Identity()
+
+    def graph_feature(self, feat, degree, src, dst, node_graph, num_graphs: int):
+        resized = self.node_init(feat)
+        # 入边邻居求和，没有入边的节点为0
+        hidden = torch.zeros_like(resized).index_add_(0, dst, resized[src])
+        has_in = (torch.zeros(feat.shape[0], dtype=feat.dtype).index_add_(
+            0, dst, torch.ones(dst.shape[0], dtype=feat.dtype)) > 0).to(feat.dtype).unsqueeze(1)
+        norm = degree.clamp(min=1)
+        stack = [resized]
+        for _ in range(self.gcn_layers):
+            norm_hidden = hidden/norm
+            reduce = torch.zeros_like(hidden).index_add_(
+                0, dst, norm_hidden[src]) + hidden*has_in
+            hidden = F.leaky_relu(self.gcn_weight(reduce))
+            stack.append(hidden)
+        stacked = torch.cat(stack, 1)
+        # 按图求平均
+        sums = torch.zeros(num_graphs, stacked.shape[1], dtype=stacked.dtype).index_add_(
+            0, node_graph, stacked)
+        counts = torch.zeros(num_graphs, dtype=stacked.dtype).index_add_(
+            0, node_graph, torch.ones(node_graph.shape[0], dtype=stacked.dtype))
+        return self.readout(sums/counts.clamp(min=1).unsqueeze(1))
+
+    def forward(self, feat, degree, src, dst, node_graph, base):
+        num_graphs = base.shape[0]
+        if self.use_graph and self.use_base:
+            final_feat = torch.cat([self.graph_feature(feat, degree, src, dst, node_graph, num_graphs),
+                                    self.graph_init(base)], -1)
+        elif self.use_graph:
+            final_feat = self.graph_feature(
+                feat, degree, src, dst, node_graph, num_graphs)
+        else:
+            final_feat = self.graph_init(base)
+        result = self.head_1(self.head_0(final_feat))
+        if self.soft:
+            result = F.softmax(result, -1)
+        return result
+
+
+# 各个模型的预测层在state_dict中的名字，以及是否使用图/基础特征、是否softmax
+HEADS = {
+    'gcnbasereg': (['predictwithbase.predict_0', 'predictwithbase.predict_1'], True, True, False),
+    'gcnbase': (['predictwithbase.predict'], True, True, True),
+    'gcn': (['predictGCN.predict'], True, False, True),
+    'base': (['predictBase.predict'], False, True, True),
+}
+
+
+def model_name(state_dict):
+    # 根据state_dict中的预测层判断模型类型，与模型的name属性一致
+    for name in ('gcnbasereg', 'gcnbase', 'gcn', 'base'):
+        if all(head+'.weight' in state_dict for head in HEADS[name][0]):
+            return name
+    raise ValueError('unknown model state_dict')
+
+
+def build(state_dict, name=None):
+    '''
+    由graph_classify中模型的state_dict构建ScriptedModel
+    :param state_dict: 模型的state_dict或者torch.save保存的路径
+    :param name: 模型的name属性，为None时根据state_dict判断
+    '''
+    if isinstance(state_dict, str):
+        state_dict = torch.load(state_dict, map_location='cpu')
+    name = model_name(state_dict) if name is None else name
+    heads, use_graph, use_base, soft = HEADS[name]
+    node_weight = state_dict['nodeedge_feat_init.init_weight_node.weight']
+    hidden_size, nodefeatsize = node_weight.shape
+    graphfeatsize = state_dict['graph_feat_init.weight'].shape[1]
+    gcn_layers = state_dict['gcn_predict.weight.weight'].shape[1]//hidden_size - 1
+    head_sizes = [state_dict[heads[0]+'.weight'].shape[1]] + \
+        [state_dict[head+'.weight'].shape[0] for head in heads]
+    res = ScriptedModel(nodefeatsize, graphfeatsize, hidden_size, gcn_layers,
+                        head_sizes, use_graph, use_base, soft)
+    weights = {'node_init': 'nodeedge_feat_init.init_weight_node', 'graph_init': 'graph_feat_init',
+               'gcn_weight': 'gcn_process.gcn_weight', 'readout': 'gcn_predict.weight'}
+    for index, head in enumerate(heads):
+        weights['head_{}'.format(index)] = head
+    res.load_state_dict({'{}.{}'.format(key, param): state_dict['{}.{}'.format(value, param)]
+                         for key, value in weights.items() for param in ('weight', 'bias')})
+    return res.eval()
+
+
+def export(state_dict, path, name=None):
+    # 保存为TorchScript，加载时不需要DGL和模型的源码
+    scripted = torch.jit.script(build(state_dict, name))
+    torch.jit.save(scripted, path)
+    return scripted
+
+
+def graph_tensors(dgl_data):
+    # 批量DGLGraph转换为ScriptedModel的输入
+    src, dst = dgl_data.edges()
+    node_graph = torch.repeat_interleave(torch.arange(
+        dgl_data.batch_size), dgl_data.batch_num_nodes())
+    return dgl_data.ndata['feat'], dgl_data.ndata['degree'], src, dst, node_graph
+
+
+class ExportedModel(nn.Module):
+    '''
+    加载导出的TorchScript，调用方式与graph_classify中的模型一致，可以直接传给model.select/model.predict
+    :param path: export保存的路径
+    '''
+
+    def __init__(self, path):
+        super().__init__()
+        self.scripted = torch.jit.load(path, map_location='cpu')
+
+    def forward(self, dgl_data, base_data):
+        return self.scripted(*graph_tensors(dgl_data), base_data)
+
+
+if __name__ == '__main__':
+    pass
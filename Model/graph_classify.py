@@ -1,6 +1,7 @@
 from torch import nn
 import torch
 import dgl
+import dgl.function as fn
 from dgl.nn.pytorch import GraphConv
 import torch.nn.functional as F
 
@@ -60,24 +61,19 @@ class SingleGCN(nn.Module):
         self.gcn_weight = weight
         self.Acti = nn.LeakyReLU()
 
-    def msg_gcn(self, edge):
-        msg = torch.div(edge.src['hidden'], edge.src['degree'])
-        return {'msg': msg}
-
-    def reduce_gcn(self, node):
-        reduce = torch.sum(node.mailbox['msg'], 1)
-        reduce = reduce+node.data['hidden']
-        return {'reduce': reduce}
-
-    def apply_gcn(self, node):
-        data = node.data['reduce']
-        result = self.gcn_weight(data)
-        return {'hidden': result}
-
     def forward(self, dgl_data: dgl.DGLGraph):
         # stack在此处只有记录的作用
-        dgl_data.update_all(self.msg_gcn, self.reduce_gcn, self.apply_gcn)
-        dgl_data.ndata['hidden'] = self.Acti(dgl_data.ndata['hidden'])
+        # 使用内置的copy_u/sum，由DGL融合为一次稀疏矩阵乘法
+        # 发送之前先除以源节点的度，有边的节点度至少为1，截断只是避免孤立节点出现nan的梯度
+        hidden = dgl_data.ndata['hidden']
+        dgl_data.ndata['norm_hidden'] = hidden / \
+            dgl_data.ndata['degree'].clamp(min=1)
+        dgl_data.update_all(fn.copy_u('norm_hidden', 'msg'),
+                            fn.sum('msg', 'reduce'))
+        # 与原来的reduce函数一致，没有入边的节点不会调用reduce，不加上自身的hidden
+        has_in = (dgl_data.in_degrees() > 0).unsqueeze(-1).to(hidden.dtype)
+        reduce = dgl_data.ndata['reduce'] + hidden*has_in
+        dgl_data.ndata['hidden'] = self.Acti(self.gcn_weight(reduce))
 
         dgl_data.ndata['stack'] = torch.cat(
             [dgl_data.ndata['stack'], dgl_data.ndata['hidden']], 1)
@@ -105,7 +101,8 @@ class GCNPredict(nn.Module):
         self.weight = nn.Linear(featsize*(layersize+1), featsize, bias=True)
 
     def forward(self, dgl_data):
-        dgl_mean = torch.mean(dgl_data.ndata['stack'], 0).reshape(1, -1)
+        # 批量图按每个子图分别求平均，单个图时为[1, featsize*(layersize+1)]
+        dgl_mean = dgl.mean_nodes(dgl_data, 'stack')
         dgl_predict = self.weight(dgl_mean)
         return dgl_predict
 
@@ -127,12 +124,12 @@ class Predictwithbase_regression(nn.Module):
     def __init__(self, in_size, hidden_size):
         super().__init__()
         self.predict_0 = nn.Linear(in_size, hidden_size)
-        self.predict_1 = nn.Linear(in_size, 1)
+        self.predict_1 = nn.Linear(hidden_size, 1)
 
     def forward(self, dgl_feat, base_feat):
         final_feat = torch.cat([dgl_feat, base_feat], -1)
         result = self.predict_0(final_feat)
-        result = self.predict_0(result)
+        result = self.predict_1(result)
         return result
 
 
@@ -164,29 +161,25 @@ class Node_feat_fusion(nn.Module):
     def __init__(self):
         super().__init__()
 
-    def msg_gcn(self, edge):
-        msg = edge.src['hidden']
-        return {'msg': msg}
-
-    def reduce_gcn(self, node):
-        reduce = torch.sum(node.mailbox['msg'], 1)
-        return {'reduce': reduce}
-
-    def apply_gcn(self, node):
-        data = node.data['reduce']
-        return {'hidden': data}
-
-    def forward(self, dgl_data: dgl.DGLGraph):
+    def forward(self, dgl_data: dgl.DGLGraph, node_weight=None):
         # while len(dgl_data.nodes) > 1:
         #     leftedNodeNum = max(len(dgl_data.nodes)//2, 1)
 
-        dgl_data.update_all(self.msg_gcn, self.reduce_gcn, self.apply_gcn)
+        if node_weight is not None:
+            # 使用数据集中预先聚合的原始特征，sum(Wx+b) = W*sum(x) + 入度*b，省去一次消息传递
+            dgl_data.ndata['hidden'] = F.linear(dgl_data.ndata['agg_feat'], node_weight.weight) + \
+                dgl_data.ndata['in_deg']*node_weight.bias
+            return dgl_data
+        # 入边邻居的hidden求和，没有入边的节点为0
+        dgl_data.update_all(fn.copy_u('hidden', 'msg'),
+                            fn.sum('msg', 'hidden'))
         return dgl_data
 
 
 class GCNModel(nn.Module):
-    def __init__(self, nodefeatsize, edgefeatsize, graphfeatsize, hidden_size, gcn_layers, classnum):
+    def __init__(self, nodefeatsize, edgefeatsize, graphfeatsize, hidden_size, gcn_layers, classnum, precomputed=False):
         super().__init__()
+        self.precomputed = precomputed  # 输入图中带有data.aggregate_features预先聚合的特征
         self.name = "gcn"
         self.nodeedge_feat_init = DGLInit(
             nodefeatsize, edgefeatsize, hidden_size)
@@ -196,11 +189,15 @@ class GCNModel(nn.Module):
         self.predictGCN = PredictOnlyGCN(hidden_size, classnum)
         self.edge2node_feat = Node_feat_fusion()
 
+    def fusion_weight(self):
+        return self.nodeedge_feat_init.init_weight_node if self.precomputed else None
+
     def forward(self, dgl_data, base_data):
-        dgl_digit = self.nodeedge_feat_init(dgl_data)
-        dgl_digit = self.edge2node_feat(dgl_digit)
-        dgl_digit = self.gcn_process(dgl_digit)
-        dgl_feat = self.gcn_predict(dgl_digit)
+        with dgl_data.local_scope():  # 中间结果不写回输入的图
+            dgl_digit = self.nodeedge_feat_init(dgl_data)
+            dgl_digit = self.edge2node_feat(dgl_digit, self.fusion_weight())
+            dgl_digit = self.gcn_process(dgl_digit)
+            dgl_feat = self.gcn_predict(dgl_digit)
         predict = self.predictGCN(dgl_feat)
         return predict
 
@@ -224,8 +221,9 @@ class BASEModel(nn.Module):
 
 
 class GCNBASEModel(nn.Module):
-    def __init__(self, nodefeatsize, edgefeatsize, graphfeatsize, hidden_size, gcn_layers, classnum):
+    def __init__(self, nodefeatsize, edgefeatsize, graphfeatsize, hidden_size, gcn_layers, classnum, precomputed=False):
         super().__init__()
+        self.precomputed = precomputed  # 输入图中带有data.aggregate_features预先聚合的特征
         self.name = "gcnbase"
         self.nodeedge_feat_init = DGLInit(
             nodefeatsize, edgefeatsize, hidden_size)
@@ -237,19 +235,24 @@ class GCNBASEModel(nn.Module):
         self.predictBase = PredictOnlyBase(hidden_size, classnum)
         self.edge2node_feat = Node_feat_fusion()
 
+    def fusion_weight(self):
+        return self.nodeedge_feat_init.init_weight_node if self.precomputed else None
+
     def forward(self, dgl_data, base_data):
         base_feat = self.graph_feat_init(base_data)
-        dgl_digit = self.nodeedge_feat_init(dgl_data)
-        dgl_digit = self.edge2node_feat(dgl_digit)
-        dgl_digit = self.gcn_process(dgl_digit)
-        dgl_feat = self.gcn_predict(dgl_digit)
+        with dgl_data.local_scope():  # 中间结果不写回输入的图
+            dgl_digit = self.nodeedge_feat_init(dgl_data)
+            dgl_digit = self.edge2node_feat(dgl_digit, self.fusion_weight())
+            dgl_digit = self.gcn_process(dgl_digit)
+            dgl_feat = self.gcn_predict(dgl_digit)
         predict = self.predictwithbase(dgl_feat, base_feat)
         return predict
 
 
 class GCNwithBASEModel_regression(nn.Module):
-    def __init__(self, nodefeatsize, edgefeatsize, graphfeatsize, hidden_size, gcn_layers):
+    def __init__(self, nodefeatsize, edgefeatsize, graphfeatsize, hidden_size, gcn_layers, precomputed=False):
         super().__init__()
+        self.precomputed = precomputed  # 输入图中带有data.aggregate_features预先聚合的特征
         self.name = "gcnbasereg"
         self.nodeedge_feat_init = DGLInit(
             nodefeatsize, edgefeatsize, hidden_size)
@@ -260,12 +263,16 @@ class GCNwithBASEModel_regression(nn.Module):
             hidden_size*2, hidden_size)
         self.edge2node_feat = Node_feat_fusion()
 
+    def fusion_weight(self):
+        return self.nodeedge_feat_init.init_weight_node if self.precomputed else None
+
     def forward(self, dgl_data, base_data):
         base_feat = self.graph_feat_init(base_data)
-        dgl_digit = self.nodeedge_feat_init(dgl_data)
-        dgl_digit = self.edge2node_feat(dgl_digit)
-        dgl_digit = self.gcn_process(dgl_digit)
-        dgl_feat = self.gcn_predict(dgl_digit)
+        with dgl_data.local_scope():  # 中间结果不写回输入的图
+            dgl_digit = self.nodeedge_feat_init(dgl_data)
+            dgl_digit = self.edge2node_feat(dgl_digit, self.fusion_weight())
+            dgl_digit = self.gcn_process(dgl_digit)
+            dgl_feat = self.gcn_predict(dgl_digit)
         predict = self.predictwithbase(dgl_feat, base_feat)
         return predict
 
@@ -1,9 +1,10 @@
 from Model import graph_classify
+from Model import checkpoint
 import torch
-from Data.Yeast import data
+from torch.utils.data.distributed import DistributedSampler
 import pickle
 import dgl
-import os
+import random
 
 
 def getmodel(nodefeatsize, edgefeatsize, graphfeatsize):
@@ -20,120 +21,171 @@ def getmodel(nodefeatsize, edgefeatsize, graphfeatsize):
 
 
 def collate(samples):
-    graphs, feats, labels = map(list, zip(*samples))
-    batch_graph = dgl.batch(graphs)
-    return batch_graph, feats, torch.tensor(labels)
-
-
-def train(model, datas, vals, batchsize, path, epoch):
+    # 一个批次的图拼接为一张DGL大图，基础特征按行拼接为[batch, graphfeatsize]
+    # 样本可以是[graph, feat, label]，也可以是没有label的[graph, feat]，此时label为None
+    columns = list(zip(*samples))
+    batch_graph = dgl.batch(columns[0])
+    labels = torch.tensor(columns[2]) if len(columns) > 2 else None
+    return batch_graph, torch.cat(columns[1], 0), labels
+
+
+def init_loader_worker(worker_id):
+    torch.set_num_threads(1)  # 并行由多个加载进程负责，避免线程数超额
+
+
+def get_loader(datas, batchsize, shuffle=False, drop_last=False, num_workers=0, prefetch=2, seed=None, num_replicas=1, rank=0):
+    '''
+    按批次组装数据的DataLoader，组装好的DGL大图和基础特征由加载进程提前准备
+    :param num_workers: 加载进程数，为0时在当前进程中组装
+    :param prefetch: 每个加载进程提前准备的批次数
+    :param drop_last: 是否丢弃最后不满一个批次的数据，训练时为True，每个epoch的批次大小相同
+    :param seed: 打乱的种子，第i个epoch之前调用loader.sampler.set_epoch(i)，排列只由seed和i决定；为None时从全局random中取
+    :param num_replicas: 数据并行的进程数，第rank个进程取排列中的rank, rank+num_replicas, ...
+    '''
+    kwargs = {}
+    if num_workers > 0:
+        # 加载进程在多个epoch之间保留，不必每个epoch重新创建
+        kwargs = dict(prefetch_factor=prefetch, persistent_workers=True,
+                      worker_init_fn=init_loader_worker)
+    # 单进程和数据并行使用同一种排列：每个epoch由seed+epoch生成，与加载进程数无关，
+    # 各个进程同一步的批次合起来正好是单进程时的一个批次
+    # DataLoader的生成器只用于加载进程的种子，不消耗全局torch随机数
+    sampler = None
+    if shuffle:
+        seed = random.getrandbits(63) if seed is None else seed
+        sampler = DistributedSampler(datas, num_replicas=num_replicas, rank=rank,
+                                     shuffle=True, seed=seed, drop_last=drop_last)
+    elif num_replicas > 1:
+        raise ValueError('num_replicas > 1 requires shuffle')
+    return torch.utils.data.DataLoader(datas, batch_size=batchsize if batchsize != -1 else max(len(datas), 1),
+                                       sampler=sampler, drop_last=drop_last, collate_fn=collate,
+                                       num_workers=num_workers, generator=torch.Generator().manual_seed(0), **kwargs)
+
+
+def train(model, datas, vals, batchsize, path, epoch, num_workers=0, prefetch=2, val_every=1, patience=None, seed=None):
+    '''
+    :param path: 模型保存的目录，每5个epoch保存一次，验证分数(各类f1之和)最好的模型保存为best.pt
+    :param patience: 验证分数多少个epoch没有提升时提前停止，None表示不提前停止
+    :param seed: 打乱数据的种子，为None时从全局random中取，相同seed下与distributed.train_distributed一致
+    :return: 最好的模型的路径，没有保存任何模型时(例如epoch=0)为None
+    '''
+    # 每个批次的损失为批内各个样本损失之和，与原来逐个样本累加一致
     cross_loss = torch.nn.CrossEntropyLoss(
-        weight=torch.FloatTensor([1, 1, 1]))  # 这苦有问题
+        weight=torch.FloatTensor([1, 1, 1]), reduction='sum')  # 这苦有问题
     optimizer = torch.optim.Adam(model.parameters(), lr=0.0001)
     model.train()
+    # 每个epoch重新打乱并丢弃最后不满的批次，批次组装与训练并行
+    train_loader = get_loader(datas, batchsize, shuffle=True, drop_last=True,
+                              num_workers=num_workers, prefetch=prefetch, seed=seed)
+    val_loader = get_loader(vals, batchsize, num_workers=num_workers,
+                            prefetch=prefetch)
+    checkpoints = checkpoint.CheckpointManager(path, 'max', patience)
     for i in range(1, epoch+1):
+        train_loader.sampler.set_epoch(i)
         epoch_loss = 0
-        # data_loader = torch.utils.data.DataLoader(
-        #     datas, batch_size=batchsize, shuffle=True, collate_fn=collate)
-        # for iter, (graphs, feats, label) in enumerate(data_loader):
-        #     prediction = model(graphs, feats)
-        #     loss = cross_loss(prediction, label)
-        #     optimizer.zero_grad()
-        #     loss.backward()
-        #     optimizer.step()
-        #     epoch_loss += loss.detach().item()  # 每一个批次的损失
-        data_gener = data.BatchGenerator(datas, batchsize)
-        for batch_data in data_gener:
-            batch_loss = 0
-            for item in batch_data:
-                target = torch.tensor(item[2], dtype=torch.long).reshape(-1)
-                predict = model(item[0], item[1])
-
-                loss = cross_loss(predict, target)
-                batch_loss += loss
-                epoch_loss += loss
+        for graphs, feats, target in train_loader:
+            predict = model(graphs, feats)  # 整个批次一次前向
+            batch_loss = cross_loss(predict, target)
             optimizer.zero_grad()
             batch_loss.backward()
             optimizer.step()
+            epoch_loss += batch_loss.detach().item()
             # print('batch loss:', batch_loss.detach().numpy())
         if i != 0 and i % 5 == 0:
-            os.makedirs(path, exist_ok=True)
-            torch.save(model.state_dict(), path+'/{}.pt'.format(i))
-
-        val_metrix = test(model, vals)
-        val_loss = 0
-        for item in vals:
-            target = torch.tensor(item[2], dtype=torch.long).reshape(-1)
-            predict = model(item[0], item[1])
-            val_loss += cross_loss(predict, target)
-        print('epoch {} loss:'.format(i), epoch_loss.detach().numpy() / len(datas),
-              'val loss:', val_loss.detach().numpy() / len(vals),
-              'val metrix:', val_metrix)
-
-
-def train_regression(model, datas, vals, batchsize, path, epoch):
-    cross_loss = torch.nn.MSELoss()
+            checkpoints.save(i, model)  # 在后台线程中写入
+
+        if i % val_every and i != epoch:  # 每val_every个epoch以及最后一个epoch验证一次
+            print('epoch {} loss:'.format(i), epoch_loss / len(datas))
+            continue
+        val_loss, val_metrix, val_classes = evaluate(
+            model, vals, cross_loss, loader=val_loader)
+        print('epoch {} loss:'.format(i), epoch_loss / len(datas),
+              'val loss:', val_loss,
+              'val metrix:', val_metrix, 'val classes:', val_classes)
+        if checkpoints.record(i, val_metrix, model):
+            print('early stop at epoch {}'.format(i))
+            break
+    return checkpoints.close()
+
+
+def train_regression(model, datas, vals, batchsize, path, epoch, num_workers=0, prefetch=2, val_every=1, patience=None, seed=None):
+    '''
+    :param path: 模型保存的目录，每5个epoch保存一次，验证损失最小的模型保存为best.pt
+    :param patience: 验证损失多少个epoch没有下降时提前停止，None表示不提前停止
+    :param seed: 打乱数据的种子，为None时从全局random中取，相同seed下与distributed.train_distributed一致
+    :return: 最好的模型的路径，没有保存任何模型时(例如epoch=0)为None
+    '''
+    # 回归模型直接拟合标签值，输出为[batch, 1]
+    cross_loss = torch.nn.MSELoss(reduction='sum')
     optimizer = torch.optim.Adam(model.parameters(), lr=0.0001)
     model.train()
+    train_loader = get_loader(datas, batchsize, shuffle=True, drop_last=True,
+                              num_workers=num_workers, prefetch=prefetch, seed=seed)
+    val_loader = get_loader(vals, batchsize, num_workers=num_workers,
+                            prefetch=prefetch)
+    checkpoints = checkpoint.CheckpointManager(path, 'min', patience)
     for i in range(1, epoch+1):
+        train_loader.sampler.set_epoch(i)
         epoch_loss = 0
-        data_loader = torch.utils.data.DataLoader(
-            datas, batch_size=batchsize, shuffle=True, collate_fn=collate)
-        for iter, (graphs, feats, label) in enumerate(data_loader):
-            prediction = model(graphs, feats)
-            loss = cross_loss(prediction, label)
-            optimizer.zero_grad()
-            loss.backward()
-            optimizer.step()
-            epoch_loss += loss.detach().item()  # 每一个批次的损失
-        data_gener = data.BatchGenerator(datas, batchsize)
-        for batch_data in data_gener:
-            batch_loss = 0
-            for item in batch_data:
-                target = torch.tensor(item[2], dtype=torch.long).reshape(-1)
-                predict = model(item[0], item[1])
-
-                loss = cross_loss(predict, target)
-                batch_loss += loss
-                epoch_loss += loss
+        for graphs, feats, label in train_loader:
+            predict = model(graphs, feats)
+            batch_loss = cross_loss(predict, label.float().reshape(-1, 1))
             optimizer.zero_grad()
             batch_loss.backward()
             optimizer.step()
+            epoch_loss += batch_loss.detach().item()
             # print('batch loss:', batch_loss.detach().numpy())
         if i != 0 and i % 5 == 0:
-            os.makedirs(path, exist_ok=True)
-            torch.save(model.state_dict(), path+'/{}.pt'.format(i))
-
-        val_metrix = test(model, vals)
-        val_loss = 0
-        for item in vals:
-            target = torch.tensor(item[2], dtype=torch.long).reshape(-1)
-            predict = model(item[0], item[1])
-            val_loss += cross_loss(predict, target)
-        print('epoch {} loss:'.format(i), epoch_loss.detach().numpy() / len(datas),
-              'val loss:', val_loss.detach().numpy() / len(vals),
-              'val metrix:', val_metrix)
-
-
-def test(model, datas):
-    labels = []
-    predicts = []
-    for item in datas:
-        labels.append(item[2])
-        pred = model(item[0], item[1])
-        pred = list(pred[0].detach().numpy())
-        predindex = pred.index(max(pred))
-        predicts.append(predindex)
-        pass
-    static_recall = [[0, 0], [0, 0], [0, 0]]
-    static_precision = [[0, 0], [0, 0], [0, 0]]
-    for index in range(len(datas)):
-        truelabel = labels[index]
-        predictlabel = predicts[index]
+            checkpoints.save(i, model)  # 在后台线程中写入
+
+        if i % val_every and i != epoch:  # 每val_every个epoch以及最后一个epoch验证一次
+            print('epoch {} loss:'.format(i), epoch_loss / len(datas))
+            continue
+        val_loss, val_metrix, val_classes = evaluate(
+            model, vals, cross_loss, regression=True, loader=val_loader)
+        print('epoch {} loss:'.format(i), epoch_loss / len(datas),
+              'val loss:', val_loss,
+              'val metrix:', val_metrix, 'val classes:', val_classes)
+        if checkpoints.record(i, val_loss, model):
+            print('early stop at epoch {}'.format(i))
+            break
+    return checkpoints.close()
+
+
+def predict(model, datas, batchsize=256, num_workers=0, prefetch=2, loader=None):
+    '''
+    批量推理，不记录梯度
+    :param datas: [graph, feat]或[graph, feat, label]的列表
+    :param loader: 可以传入get_loader(datas, ...)预先建好的加载器，多次推理时复用加载进程
+    :return: [len(datas), 输出维数]的分数tensor，顺序与datas一致
+    '''
+    if loader is None:
+        loader = get_loader(datas, batchsize,
+                            num_workers=num_workers, prefetch=prefetch)
+    training = model.training
+    model.eval()
+    scores = []
+    with torch.inference_mode():
+        for graphs, feats, _ in loader:
+            scores.append(model(graphs, feats))
+    model.train(training)
+    return torch.cat(scores, 0) if scores else torch.zeros(0, 0)
+
+
+def class_metrix(labels, predicts, classnum=3):
+    '''
+    每一类的recall/precision/f1，与原来test的统计方式一致，某一类没有样本时recall/precision记为1
+    :return: ([(recall, precision, f1), ...], 各类f1之和)
+    '''
+    static_recall = [[0, 0] for _ in range(classnum)]
+    static_precision = [[0, 0] for _ in range(classnum)]
+    for truelabel, predictlabel in zip(labels, predicts):
         static_recall[truelabel][1] += 1
         static_precision[predictlabel][1] += 1
         if truelabel == predictlabel:
             static_recall[truelabel][0] += 1
             static_precision[predictlabel][0] += 1
+    classes = []
     res = 0
     for index in range(len(static_recall)):
         recallnum = static_recall[index][0] / \
@@ -143,21 +195,51 @@ def test(model, datas):
         f1num = 2*recallnum*precinum / \
             (recallnum+precinum) if recallnum+precinum else 0
         # print("recall {},prec {},f1 {}".format(recallnum, precinum, f1num))
+        classes.append((recallnum, precinum, f1num))
         res += f1num
-    return res
-
-
-def select(model, datas, thred):
-    res = []
-    for item in datas:
-        pred = model(item[0], item[1])
-        pred = list(pred[0].detach().numpy())
-        predindex = pred.index(max(pred))
-        if predindex == 0 or pred[0] >= thred:
-            res.append(True)
-        else:
-            res.append(False)
-    return res
+    return classes, res
+
+
+def predict_labels(scores, classnum=3):
+    # 分类模型取分数最大的类，与list.index(max(...))一致，并列时取第一个
+    # 回归模型只有一列输出，四舍五入并截断到[0, classnum-1]作为类别
+    if scores.shape[1] == 1:
+        return scores[:, 0].round().clamp(0, classnum-1).long().tolist()
+    return scores.argmax(1).tolist()
+
+
+def test(model, datas, batchsize=256, num_workers=0, prefetch=2):
+    labels = [item[2] for item in datas]
+    predicts = predict_labels(predict(model, datas, batchsize, num_workers,
+                                      prefetch)) if len(datas) else []
+    return class_metrix(labels, predicts)[1]
+
+
+def evaluate(model, datas, loss_func, regression=False, batchsize=256, num_workers=0, prefetch=2, loader=None):
+    '''
+    验证集只做一次不记录梯度的批量推理，损失和各项指标都由同一份预测结果得到
+    :param loss_func: reduction为sum的损失函数
+    :param regression: 回归模型的目标为[n, 1]的浮点数，各项指标按四舍五入之后的类别统计
+    :return: (平均损失, 各类f1之和, 每一类的(recall, precision, f1))
+    '''
+    if not len(datas):
+        return 0, 0, []
+    labels = [item[2] for item in datas]
+    scores = predict(model, datas, batchsize, num_workers, prefetch, loader)
+    target = torch.tensor(labels)
+    target = target.float().reshape(-1, 1) if regression else target
+    loss = loss_func(scores, target).item()/len(datas)
+    classes, res = class_metrix(labels, predict_labels(scores))
+    return loss, res, classes
+
+
+def select(model, datas, thred, batchsize=256, num_workers=0, prefetch=2):
+    # datas为[graph, feat]的列表，预测为第0类或者第0类的分数不低于thred时选中
+    if not len(datas):
+        return []
+    scores = predict(model, datas, batchsize, num_workers, prefetch)
+    res = (scores.argmax(1) == 0) | (scores[:, 0] >= thred)
+    return res.tolist()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,113 @@
+import numpy as np
+from scipy import sparse
+
+
+class ProteinIndex():
+    '''
+    蛋白质id到int32编号的全局映射表
+    :param names: 初始的蛋白质id，例如全局图的节点顺序，这样编号与图中的位置一致
+    '''
+
+    def __init__(self, names=()):
+        self.names = []
+        self.index = {}
+        for name in names:
+            self.intern(name)
+
+    def __len__(self):
+        return len(self.names)
+
+    def intern(self, name):
+        if name not in self.index:
+            self.index[name] = len(self.names)
+            self.names.append(name)
+        return self.index[name]
+
+    def encode(self, nodes):
+        return np.unique(np.array([self.intern(node) for node in nodes], dtype=np.int32))
+
+    def decode(self, members):
+        return set(self.names[member] for member in members)
+
+
+class ComplexSet():
+    '''
+    复合物集合，以CSR的方式存储：第i个复合物为members[offsets[i]:offsets[i+1]]，组内编号升序
+    '''
+
+    def __init__(self, index, offsets, members):
+        self.index = index
+        self.offsets = offsets
+        self.members = members
+
+    @classmethod
+    def from_sets(cls, complexes, index=None):
+        index = ProteinIndex() if index is None else index
+        if isinstance(complexes, ComplexSet):
+            if complexes.index is index:
+                return complexes
+            complexes = complexes.to_sets()
+        return cls.from_members([index.encode(comp) for comp in complexes], index)
+
+    @classmethod
+    def from_members(cls, complexes, index):
+        # complexes中的每一项已经是编号
+        encoded = [np.unique(np.asarray(comp, dtype=np.int32))
+                   for comp in complexes]
+        offsets = np.zeros(len(encoded)+1, dtype=np.int64)
+        np.cumsum([len(comp) for comp in encoded], out=offsets[1:])
+        members = np.concatenate(
+            encoded) if encoded else np.zeros(0, dtype=np.int32)
+        return cls(index, offsets, members.astype(np.int32))
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, i):
+        return self.members[self.offsets[i]:self.offsets[i+1]]
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+    def __add__(self, other):
+        # 与list相加一致，拼接两个复合物集合
+        other = ComplexSet.from_sets(other, self.index)
+        return ComplexSet(self.index, np.concatenate([self.offsets, other.offsets[1:]+self.offsets[-1]]),
+                          np.concatenate([self.members, other.members]))
+
+    def sizes(self):
+        return np.diff(self.offsets)
+
+    def subset(self, indices):
+        indices = np.asarray(indices, dtype=np.int64)
+        sizes = self.sizes()[indices]
+        offsets = np.zeros(len(indices)+1, dtype=np.int64)
+        np.cumsum(sizes, out=offsets[1:])
+        positions = np.repeat(self.offsets[indices]-offsets[:-1], sizes) + \
+            np.arange(offsets[-1])
+        return ComplexSet(self.index, offsets, self.members[positions])
+
+    def to_sets(self):
+        return [self.index.decode(comp) for comp in self]
+
+    def incidence(self):
+        # 复合物 × 蛋白质的0/1稀疏矩阵
+        return sparse.csr_matrix((np.ones(len(self.members), dtype=np.float64), self.members, self.offsets),
+                                 shape=(len(self), len(self.index)))
+
+    def intersection_sizes(self, other):
+        '''
+        两个复合物集合两两之间的交集大小
+        :return: len(self) × len(other)的稀疏矩阵，只保存交集非空的位置
+        '''
+        if other.index is not self.index:
+            raise ValueError('complex sets must share the same protein index')
+        return (self.incidence() @ other.incidence().T).tocsr()
+
+
+def align(*complex_lists):
+    # 将多个复合物集合转换为共用同一个编号表的ComplexSet
+    index = next((item.index for item in complex_lists if isinstance(
+        item, ComplexSet)), ProteinIndex())
+    return [ComplexSet.from_sets(item, index) for item in complex_lists]
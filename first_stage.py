@@ -1,6 +1,7 @@
 from Data.Yeast import data
 from Model import graph_classify
 from Model import model
+from Model import distributed
 import random
 import torch
 import time
@@ -37,11 +38,18 @@ if __name__ == "__main__":
     model_path = "Model/saved_models/{}_{}".format(base_model.name,
                                                    time.strftime('%m_%d_%H_%M', time.localtime()))
     default_epoch = 50
+    patience = 10  # 验证损失10个epoch没有下降时提前停止
+    world_size = 1  # 大于1时多进程数据并行训练，batchsize需要是它的倍数
 
-    model.train_regression(base_model, traindatas, valdatas,
-                           batchsize, model_path, default_epoch)
-    base_model.load_state_dict(torch.load(
-        model_path+'/{}.pt'.format(default_epoch)))
+    if world_size > 1:
+        best_path = distributed.train_distributed(base_model, traindatas, valdatas, batchsize, model_path,
+                                                  default_epoch, world_size, regression=True, patience=patience)
+    else:
+        best_path = model.train_regression(base_model, traindatas, valdatas,
+                                           batchsize, model_path, default_epoch, patience=patience)
+    # 加载验证集上最好的模型，之后也可以用checkpoint.best_path(model_path)找到
+    if best_path is not None:
+        base_model.load_state_dict(torch.load(best_path))
     # base_model.load_state_dict(torch.load(
     #     "Model/saved_models_base_11_28_19_39/10.pt"))
     model.test(base_model, testdatas)
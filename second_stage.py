@@ -1,6 +1,7 @@
 from Data.Yeast import data
 from Model import graph_classify
 from Model import model
+from Model import checkpoint
 import random
 import torch
 import time
@@ -132,18 +133,14 @@ def main():
     nodeWithFeat_path = "Data/Yeast/embedding/dip_node"
     edgeWithFeat_path = "Data/Yeast/embedding/dip_edge"
     edge_path = "Data/Yeast/embedding/dip_edge_nofeat"
-    model_path = "Model/saved_models/gcnbase_12_02_10_23/30.pt"
+    model_dir = "Model/saved_models/gcnbase_12_02_10_23"
     bench_path = "Data/Yeast/bench/CYC2008"
     RELOAD = False
 
     normal_datas, expand_candi_datas, expand_path = prepare_compare(
         "mcode", edge_path, RELOAD)
-    subgraphs_expand_path = expand_path+"_graphs"
+    selected_expand_path = expand_path+"_selected"
 
-    expand_candi_graphs = data.second_stage(
-        nodeWithFeat_path, edgeWithFeat_path, expand_candi_datas, subgraphs_expand_path, reload=RELOAD, direct=False)
-    expand_candi_graphs = [[item.graph, item.feat]
-                           for item in expand_candi_graphs]
     nodefeatsize = 420
     edgefeatsize = 10
     graphfeatsize = 10
@@ -156,12 +153,23 @@ def main():
         gcn_layers=2,
         classnum=3
     )
+    # 加载训练时记录在manifest.json中的最好的模型
+    model_path = checkpoint.best_path(model_dir)
+    if model_path is None:
+        raise FileNotFoundError('no checkpoint manifest in {}'.format(model_dir))
     base_model.load_state_dict(torch.load(model_path))
-    res = model.select(base_model, expand_candi_graphs, 0.3)
+    # 候选按块转换并打分，选中的结果逐块写入文件，内存占用与候选数目无关
     expand_datas = []
-    for index, val in enumerate(res):
-        if val:
-            expand_datas.append(expand_candi_datas[index])
+    with open(selected_expand_path, 'w') as f:
+        for chunk_datas, chunk_graphs in data.iter_second_stage(
+                nodeWithFeat_path, edgeWithFeat_path, expand_candi_datas, direct=False):
+            res = model.select(
+                base_model, [[item.graph, item.feat] for item in chunk_graphs], 0.3)
+            for index, val in enumerate(res):
+                if val:
+                    expand_datas.append(chunk_datas[index])
+                    f.write('\t'.join(sorted(chunk_datas[index]))+'\n')
+            f.flush()
 
     bench_datas = data.read_bench(bench_path)
 
@@ -0,0 +1,23 @@
+import pytest
+import torch
+import dgl
+
+
+def random_graph(num_nodes, num_edges, isolated=1):
+    '''
+    与数据集中的图一致的随机有向图：节点特征、度数和边特征
+    0号节点只有出边，另外加上isolated个没有任何边的节点
+    '''
+    src = torch.randint(0, num_nodes, (num_edges,))
+    dst = torch.randint(1, num_nodes, (num_edges,))
+    graph = dgl.graph((src, dst), num_nodes=num_nodes+isolated)
+    graph.ndata['feat'] = torch.randn(graph.num_nodes(), 63)
+    graph.ndata['degree'] = (graph.in_degrees() +
+                             graph.out_degrees()).float().reshape(-1, 1)
+    graph.edata['feat'] = torch.randn(graph.num_edges(), 10)
+    return graph
+
+
+@pytest.fixture
+def make_graph():
+    return random_graph
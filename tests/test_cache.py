@@ -0,0 +1,15 @@
+import os
+from Data.Yeast import data
+
+
+def test_save_paths_do_not_evict_each_other(tmp_path):
+    # 同一目录下的不同save_path各自保留最新的一份
+    paths = [str(tmp_path / name) for name in ('mcode_expand.pkl', 'coach_expand.pkl')]
+    for key in ('a'*40, 'b'*40):
+        for path in paths:
+            data.get_cache(path).save(data.cache_stage('second_stage', path), key, key)
+    for path in paths:
+        artifacts, stage = data.get_cache(path), data.cache_stage('second_stage', path)
+        assert artifacts.load(stage, 'b'*40) == (True, 'b'*40)
+        assert artifacts.load(stage, 'a'*40) == (False, None)
+    assert len(os.listdir(tmp_path / 'cache')) == 2
@@ -0,0 +1,80 @@
+import random
+import pytest
+from Data.Yeast import data
+from Utils.complexset import ComplexSet
+
+
+# 改为倒排索引/稀疏矩阵之前逐一两两比较的实现，只作为对照
+def reference_merge(items, threshold):
+    all_merged_res, all_counts = [], []
+    for item in items:
+        cur_merge_target = []
+        tempres, count = item, 1
+        for index, single_res in enumerate(all_merged_res):
+            if len(item & single_res)/(len(item | single_res)) > threshold:
+                cur_merge_target.append(index)
+                tempres = tempres | single_res
+                count += all_counts[index]
+        for removeindex in cur_merge_target[::-1]:
+            all_merged_res.pop(removeindex)
+            all_counts.pop(removeindex)
+        all_merged_res.append(tempres)
+        all_counts.append(count)
+    res, counts = list(), list()
+    for data_, count in zip(all_merged_res, all_counts):
+        if len(data_) >= 2:
+            res.append(data_)
+            counts.append(count)
+    return res, counts
+
+
+def reference_dedup(complexes, targets, threshold):
+    res = []
+    for comp in complexes:
+        if max(pow(len(comp & targ), 2)/(len(comp)*len(targ)) for targ in targets) >= threshold:
+            continue
+        res.append(comp)
+    return res
+
+
+def random_complexes(rng, num, universe=40):
+    # 一部分由已有的复合物小幅改动得到，保证有足够多的合并和重复
+    proteins = ['P{}'.format(i) for i in range(universe)]
+    res = []
+    for _ in range(num):
+        if res and rng.random() < 0.5:
+            item = set(rng.choice(res))
+            item.discard(rng.choice(sorted(item)))
+            item.add(rng.choice(proteins))
+        else:
+            item = set(rng.sample(proteins, rng.randint(1, 8)))
+        res.append(item)
+    return res
+
+
+@pytest.mark.parametrize('threshold', [data.MERGE_THRESHOLD, 0.5, 0.2])
+def test_merge_matches_pairwise(threshold):
+    rng = random.Random(0)
+    for _ in range(200):
+        items = random_complexes(rng, rng.randint(0, 40))
+        expect, expect_counts = reference_merge(items, threshold)
+        assert data.merged_data(items, threshold) == expect
+        result, counts = data.merged_data(items, threshold, return_counts=True)
+        assert result == expect and counts == expect_counts
+        # ComplexSet输入返回ComplexSet，内容和顺序一致
+        result, counts = data.merged_data(
+            ComplexSet.from_sets(items), threshold, return_counts=True)
+        assert isinstance(result, ComplexSet)
+        assert result.to_sets() == expect and counts == expect_counts
+
+
+@pytest.mark.parametrize('threshold', [data.DUPLICATE_THRESHOLD, 0.5])
+def test_dedup_matches_pairwise(threshold):
+    rng = random.Random(1)
+    for _ in range(200):
+        complexes = random_complexes(rng, rng.randint(0, 30))
+        targets = random_complexes(rng, rng.randint(1, 30))
+        expect = reference_dedup(complexes, targets, threshold)
+        assert data.remove_duplicate(complexes, targets, threshold) == expect
+        result = data.remove_duplicate(ComplexSet.from_sets(complexes), targets, threshold)
+        assert isinstance(result, ComplexSet) and result.to_sets() == expect
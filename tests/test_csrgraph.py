@@ -0,0 +1,33 @@
+import numpy as np
+import networkx as nx
+import pytest
+from Data.Yeast.csrgraph import CSRGraph
+
+
+def nx_graph(ids, edges, node_feat, edge_feat, direct):
+    # 与data.get_global_nxgraph的建图方式一致
+    res = nx.DiGraph()
+    for index, node in enumerate(ids):
+        res.add_node(node, w=node_feat[index])
+    for index, (v0, v1) in enumerate(edges):
+        res.add_edge(ids[v0], ids[v1], w=edge_feat[index])
+        if not direct:
+            res.add_edge(ids[v1], ids[v0], w=edge_feat[index])
+    return res
+
+
+@pytest.mark.parametrize('direct', [True, False])
+def test_from_edges_matches_networkx(direct):
+    rng = np.random.RandomState(0)
+    ids = ['P{}'.format(i) for i in range(30)]
+    edges = rng.randint(0, 30, (120, 2))
+    # 同时出现a-b和b-a，以及重复的边和自环
+    edges = np.concatenate([edges, edges[:10, ::-1], edges[20:25], [[3, 3], [4, 4]]])
+    node_feat, edge_feat = rng.rand(30, 4), rng.rand(len(edges), 3)
+    graph = CSRGraph.from_edges(ids, edges[:, 0], edges[:, 1], node_feat, edge_feat, direct)
+    expect = nx_graph(ids, edges.tolist(), node_feat, edge_feat, direct)
+    result = graph.to_networkx()
+    assert set(result.edges()) == set(expect.edges())
+    for v0, v1, feat in expect.edges(data='w'):
+        assert np.array_equal(result.edges[v0, v1]['w'], feat), (v0, v1)
+    assert np.array_equal(graph.degree(), [expect.degree(node) for node in ids])
@@ -0,0 +1,26 @@
+import copy
+import os
+import torch
+from Model import graph_classify
+from Model import model as trainer
+from Model import distributed
+
+
+def test_matches_single_process(make_graph, tmp_path):
+    # 相同的初始参数和seed，单进程和1、2个进程数据并行训练得到的参数一致
+    torch.manual_seed(0)
+    datas = [[make_graph(3+i % 5, 4+i % 7), torch.randn(1, 10), i % 3] for i in range(30)]
+    vals = datas[:6]
+    model = graph_classify.GCNwithBASEModel_regression(63, 10, 10, 16, 2)
+    paths = [str(tmp_path / name) for name in ('single', 'world1', 'world2')]
+    trainer.train_regression(copy.deepcopy(model), datas, vals, 4, paths[0], 5,
+                             val_every=5, seed=3)
+    for world_size, path in ((1, paths[1]), (2, paths[2])):
+        distributed.train_distributed(copy.deepcopy(model), datas, vals, 4, path, 5,
+                                      world_size, regression=True, seed=3, val_every=5)
+    states = [torch.load(os.path.join(path, '5.pt')) for path in paths]
+    assert any(not torch.equal(states[0][key], value)
+               for key, value in model.state_dict().items())
+    for state in states[1:]:
+        for key in states[0]:
+            assert torch.allclose(state[key], states[0][key], atol=1e-6), key
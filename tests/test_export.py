@@ -0,0 +1,56 @@
+import pytest
+import torch
+from Model import graph_classify
+from Model import export
+from Model import model as trainer
+
+
+MODELS = {
+    'gcnbasereg': lambda: graph_classify.GCNwithBASEModel_regression(63, 10, 10, 16, 2),
+    'gcnbase': lambda: graph_classify.GCNBASEModel(63, 10, 10, 16, 2, 3),
+    'gcn': lambda: graph_classify.GCNModel(63, 10, 10, 16, 2, 3),
+    'base': lambda: graph_classify.BASEModel(63, 10, 10, 16, 2, 3),
+}
+
+
+@pytest.fixture
+def datas(make_graph):
+    torch.manual_seed(0)
+    return [[make_graph(3+i % 5, 4+2*i), torch.randn(1, 10)] for i in range(12)]
+
+
+@pytest.fixture(params=list(MODELS))
+def models(request, tmp_path):
+    torch.manual_seed(1)
+    eager = MODELS[request.param]().eval()
+    assert eager.name == request.param
+    path = str(tmp_path / 'model.pt')
+    export.export(eager.state_dict(), path)
+    return eager, export.ExportedModel(path).eval()
+
+
+def test_batched_graph(models, datas):
+    eager, exported = models
+    graphs, feats, _ = trainer.collate(datas)
+    with torch.no_grad():
+        expect = eager(graphs, feats)
+        result = exported(graphs, feats)
+    assert result.shape == expect.shape
+    assert torch.allclose(result, expect, atol=1e-5)
+
+
+def test_single_graph(models, datas):
+    eager, exported = models
+    graph, feat = datas[0]
+    with torch.no_grad():
+        expect = eager(graph, feat)
+        result = exported(graph, feat)
+    assert torch.allclose(result, expect, atol=1e-5)
+
+
+def test_select(models, datas):
+    eager, exported = models
+    # 阈值取中位数附近，选中和不选中的都有
+    thred = trainer.predict(eager, datas)[:, 0].median().item()
+    assert trainer.select(eager, datas, thred, batchsize=5) == \
+        trainer.select(exported, datas, thred, batchsize=5)
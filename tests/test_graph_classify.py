@@ -0,0 +1,128 @@
+import copy
+import pytest
+import torch
+from torch import nn
+import dgl
+from Model import graph_classify
+
+
+# 改为内置copy_u/sum之前的UDF实现，只作为对照
+class RefSingleGCN(nn.Module):
+    def __init__(self, weight):
+        super().__init__()
+        self.gcn_weight = weight
+        self.Acti = nn.LeakyReLU()
+
+    def msg_gcn(self, edge):
+        msg = torch.div(edge.src['hidden'], edge.src['degree'])
+        return {'msg': msg}
+
+    def reduce_gcn(self, node):
+        reduce = torch.sum(node.mailbox['msg'], 1)
+        reduce = reduce+node.data['hidden']
+        return {'reduce': reduce}
+
+    def apply_gcn(self, node):
+        data = node.data['reduce']
+        result = self.gcn_weight(data)
+        return {'hidden': result}
+
+    def forward(self, dgl_data):
+        dgl_data.update_all(self.msg_gcn, self.reduce_gcn, self.apply_gcn)
+        dgl_data.ndata['hidden'] = self.Acti(dgl_data.ndata['hidden'])
+
+        dgl_data.ndata['stack'] = torch.cat(
+            [dgl_data.ndata['stack'], dgl_data.ndata['hidden']], 1)
+        return dgl_data
+
+
+class RefNodeFeatFusion(nn.Module):
+    def msg_gcn(self, edge):
+        msg = edge.src['hidden']
+        return {'msg': msg}
+
+    def reduce_gcn(self, node):
+        reduce = torch.sum(node.mailbox['msg'], 1)
+        return {'reduce': reduce}
+
+    def apply_gcn(self, node):
+        data = node.data['reduce']
+        return {'hidden': data}
+
+    def forward(self, dgl_data, node_weight=None):
+        dgl_data.update_all(self.msg_gcn, self.reduce_gcn, self.apply_gcn)
+        return dgl_data
+
+
+def reference(model):
+    # 同一份参数，消息传递换成原来的UDF
+    res = copy.deepcopy(model)
+    process = res.gcn_process
+    process.GCNlayers = nn.ModuleList(
+        [RefSingleGCN(process.gcn_weight) for _ in process.GCNlayers])
+    res.edge2node_feat = RefNodeFeatFusion()
+    return res
+
+
+@pytest.fixture
+def batch(make_graph):
+    torch.manual_seed(0)
+    graphs = dgl.batch([make_graph(6, 12, 2), make_graph(4, 5, 1),
+                        make_graph(8, 20, 0)])
+    return graphs, torch.randn(3, 10)
+
+
+def grads(model):
+    return {name: param.grad for name, param in model.named_parameters()
+            if param.grad is not None}
+
+
+@pytest.mark.parametrize('name', ['GCNModel', 'GCNBASEModel'])
+def test_matches_udf(name, batch):
+    graphs, feats = batch
+    assert (graphs.in_degrees() == 0).sum() > 0
+    torch.manual_seed(1)
+    model = getattr(graph_classify, name)(63, 10, 10, 16, 2, 3)
+    ref = reference(model)
+    out, ref_out = model(graphs, feats), ref(graphs, feats)
+    assert torch.allclose(out, ref_out, atol=1e-6)
+    out.sum().backward()
+    ref_out.sum().backward()
+    new_grads, ref_grads = grads(model), grads(ref)
+    assert new_grads.keys() == ref_grads.keys()
+    for key in new_grads:
+        assert torch.allclose(new_grads[key], ref_grads[key], atol=1e-5), key
+
+
+def test_regression_matches_udf(batch):
+    graphs, feats = batch
+    torch.manual_seed(2)
+    model = graph_classify.GCNwithBASEModel_regression(63, 10, 10, 16, 3)
+    ref = reference(model)
+    out, ref_out = model(graphs, feats), ref(graphs, feats)
+    assert torch.allclose(out, ref_out, atol=1e-6)
+    out.sum().backward()
+    ref_out.sum().backward()
+    new_grads, ref_grads = grads(model), grads(ref)
+    for key in ref_grads:
+        assert torch.allclose(new_grads[key], ref_grads[key], atol=1e-5), key
+
+
+def test_layers_match_udf(batch):
+    # 单独的层：孤立节点和没有入边的节点不加上自身的hidden
+    graphs, _ = batch
+    torch.manual_seed(3)
+    hidden = torch.randn(graphs.num_nodes(), 16, requires_grad=True)
+    weight = nn.Linear(16, 16)
+    outputs = []
+    for fusion, layer in ((graph_classify.Node_feat_fusion(), graph_classify.SingleGCN(16, 16, weight)),
+                          (RefNodeFeatFusion(), RefSingleGCN(weight))):
+        with graphs.local_scope():
+            graphs.ndata['hidden'] = hidden
+            graphs.ndata['stack'] = hidden
+            res = layer(fusion(graphs))
+            outputs.append(res.ndata['stack'])
+    assert torch.allclose(outputs[0], outputs[1], atol=1e-6)
+    new_grad = torch.autograd.grad(outputs[0].sum(), hidden)[0]
+    ref_grad = torch.autograd.grad(outputs[1].sum(), hidden)[0]
+    assert torch.allclose(new_grad, ref_grad, atol=1e-5)
@@ -0,0 +1,32 @@
+import torch
+from torch import nn
+from Model import model as trainer
+
+
+class Constant(nn.Module):
+    # 输出基础特征的前outputs列，用来控制预测结果
+    def __init__(self, outputs):
+        super().__init__()
+        self.outputs = outputs
+
+    def forward(self, dgl_data, base_data):
+        return base_data[:, :self.outputs]
+
+
+def test_predict_labels():
+    assert trainer.predict_labels(torch.tensor([[0.2, 0.7, 0.1], [0.5, 0.5, 0.0]])) == [1, 0]
+    assert trainer.predict_labels(torch.tensor([[-0.7], [0.4], [0.6], [1.5], [7.0]])) == [0, 0, 1, 2, 2]
+
+
+def test_regression_metrics(make_graph):
+    # 回归模型的指标按四舍五入之后的类别统计，而不是对[n, 1]取argmax
+    values, labels = [0.1, 1.2, 1.9, 2.4, 0.7], [0, 1, 2, 2, 0]
+    datas = [[make_graph(4, 6), torch.tensor([[value]]), label]
+             for value, label in zip(values, labels)]
+    loss, res, classes = trainer.evaluate(Constant(1), datas, nn.MSELoss(reduction='sum'),
+                                          regression=True)
+    assert abs(loss - sum((v-l)**2 for v, l in zip(values, labels))/5) < 1e-6
+    assert classes[0] == (0.5, 1.0, 2/3)
+    assert classes[1] == (1.0, 0.5, 2/3)
+    assert classes[2] == (1.0, 1.0, 1.0)
+    assert trainer.test(Constant(1), datas) == res
@@ -0,0 +1,37 @@
+import random
+import numpy as np
+import pytest
+from Data.Yeast import data
+from Data.Yeast.csrgraph import CSRGraph
+
+
+@pytest.fixture(scope='module')
+def graph():
+    rng = np.random.RandomState(0)
+    ids = ['P{}'.format(i) for i in range(60)]
+    edges = rng.randint(0, 60, (300, 2))
+    return CSRGraph.from_edges(ids, edges[:, 0], edges[:, 1], rng.rand(60, 4),
+                               rng.rand(len(edges), 3), False)
+
+
+def test_same_seed_same_graphs(graph):
+    expect = data.get_random_graphs(graph, [3, 5, 8], 40, seed=7)
+    assert len(expect) == 40 and all(expect)
+    assert data.get_random_graphs(graph, [3, 5, 8], 40, seed=7) == expect
+    assert data.get_random_graphs(graph, [3, 5, 8], 40, seed=8) != expect
+
+
+def test_independent_of_processes(graph):
+    # 同一个seed下结果与进程数无关
+    expect = data.get_random_graphs(graph, [3, 5, 8], 40, seed=7)
+    for processes in (1, 2, 3):
+        assert data.get_random_graphs(graph, [3, 5, 8], 40, multi=True,
+                                      seed=7, processes=processes) == expect
+
+
+def test_global_random_seed(graph):
+    # 不给seed时由全局random决定
+    random.seed(3)
+    expect = data.get_random_graphs(graph, [3, 5, 8], 20)
+    random.seed(3)
+    assert data.get_random_graphs(graph, [3, 5, 8], 20) == expect
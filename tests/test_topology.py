@@ -0,0 +1,63 @@
+import warnings
+import numpy as np
+import networkx as nx
+import pytest
+from Data.Yeast.csrgraph import CSRGraph
+from Data.Yeast import topology
+
+
+def reference_features(graph, direct):
+    # 改为批量计算之前single_data.get_default_feature的做法
+    degrees = np.array([item[1] for item in nx.degree(graph)])
+    clusters = nx.clustering(graph)
+    clusters = np.array([clusters[item] for item in clusters.keys()])
+    result = [len(graph.nodes), nx.density(graph), degrees.mean(), degrees.max(), degrees.min(),
+              degrees.var(), clusters.mean(), clusters.max(), clusters.var()]
+    if not direct:
+        result.append(nx.degree_pearson_correlation_coefficient(graph))
+    return result
+
+
+def random_graph(direct, seed=0):
+    rng = np.random.RandomState(seed)
+    ids = ['P{}'.format(i) for i in range(40)]
+    edges = rng.randint(0, 40, (160, 2))
+    edges[:8, 1] = edges[:8, 0]  # 自环
+    return CSRGraph.from_edges(ids, edges[:, 0], edges[:, 1], rng.rand(40, 4),
+                               rng.rand(len(edges), 3), direct), ids, rng
+
+
+@pytest.mark.parametrize('direct', [True, False])
+def test_matches_networkx(direct):
+    graph, ids, rng = random_graph(direct)
+    candidates = [set(rng.choice(ids, rng.randint(3, 12), replace=False))
+                  for _ in range(100)]
+    result = topology.default_features(graph, candidates, direct, chunk_size=16).numpy()
+    assert result.shape == (len(candidates), 9 if direct else 10)
+    checked = 0
+    for index, item in enumerate(candidates):
+        with warnings.catch_warnings():
+            warnings.simplefilter('ignore')
+            try:
+                expect = reference_features(graph.subgraph(item).to_networkx(), direct)
+            except Exception:  # 原来的实现在边数为0或1时出错，见test_degenerate_subgraphs
+                continue
+        if not np.all(np.isfinite(expect)):
+            continue
+        assert np.allclose(result[index], expect, atol=1e-5), item
+        checked += 1
+    assert checked > 50
+
+
+def test_degenerate_subgraphs():
+    # 没有边、只有一条边或者只有一个节点的子图：度相关系数没有定义，结果为0，不再出错或得到nan
+    graph, ids, _ = random_graph(False, seed=1)
+    adjacency = graph.to_networkx()
+    no_edge = next([u, v] for u in ids for v in ids
+                   if u != v and not adjacency.has_edge(u, v) and
+                   not adjacency.has_edge(u, u) and not adjacency.has_edge(v, v))
+    u, v = next(edge for edge in adjacency.edges() if edge[0] != edge[1])
+    result = topology.default_features(graph, [set(no_edge), {u, v}, {ids[0]}], False).numpy()
+    assert np.all(np.isfinite(result))
+    assert np.all(result[:, -1] == 0)
+    assert result[0, 1] == 0 and result[2, 1] == 0